@@ -0,0 +1,235 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from app.config import Config
+
+config = Config()
+
+
+class DocumentVersions:
+    """
+    Current version (ETag or content hash) of every indexed document.
+
+    Kept in SQLite next to the embedding cache so every worker sees the same
+    versions. The vector store updates it whenever a document's new version
+    replaces the old one and when documents are deleted.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS document_versions (
+                   source TEXT PRIMARY KEY,
+                   version TEXT NOT NULL,
+                   updated_at INTEGER NOT NULL
+               )"""
+        )
+
+    def set(self, source: str, version: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO document_versions (source, version, updated_at) VALUES (?, ?, ?)",
+                (source, version, time.time_ns())
+            )
+
+    def remove(self, sources: List[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM document_versions WHERE source = ?", [(s,) for s in sources])
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM document_versions")
+
+    def get(self, sources: List[str]) -> Dict[str, Optional[str]]:
+        with self._lock:
+            rows = dict(self._conn.execute(
+                f"SELECT source, version FROM document_versions WHERE source IN ({','.join('?' * len(sources))})",
+                sources
+            ).fetchall()) if sources else {}
+        return {s: rows.get(s) for s in sources}
+
+    def corpus_version(self) -> str:
+        """Changes whenever any document is added, replaced or deleted."""
+        with self._lock:
+            count, latest = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(updated_at), 0) FROM document_versions"
+            ).fetchone()
+            # Deletes shrink the count; adds and replacements move updated_at
+            return f"{count}:{latest}"
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    embedding: np.ndarray
+    answer: Dict
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class _Scope:
+    """
+    Entries of one scope with their embeddings as rows of one matrix, so a
+    lookup is a single product over the used rows. The matrix grows by
+    doubling and removals move the last row into the gap.
+    """
+
+    def __init__(self, dim: int):
+        self.entries: List[CachedAnswer] = []
+        self.rows: Dict[int, int] = {}  # id(entry) -> row
+        self.matrix = np.empty((8, dim), dtype=np.float32)
+
+    def add(self, entry: CachedAnswer):
+        row = len(self.entries)
+        if row == self.matrix.shape[0]:
+            self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+        self.matrix[row] = entry.embedding
+        self.entries.append(entry)
+        self.rows[id(entry)] = row
+
+    def remove(self, entry: CachedAnswer):
+        row = self.rows.pop(id(entry), None)
+        if row is None:
+            return
+        last = self.entries.pop()
+        if last is not entry:
+            self.entries[row] = last
+            self.matrix[row] = self.matrix[len(self.entries)]
+            self.rows[id(last)] = row
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        return self.matrix[:len(self.entries)] @ query
+
+
+class SemanticAnswerCache:
+    """
+    In-process cache of generated answers, looked up by question similarity.
+
+    Answers are grouped by scope: the retrieval mode, the LLM and the selected
+    documents together with their current versions. When a document is
+    re-ingested or deleted its version changes, so every scope containing it
+    gets a new key and its old answers are never served again (they age out
+    through TTL and LRU eviction).
+
+    Within a scope, a question hits if the cosine similarity of its embedding
+    to a cached question is at least `threshold`. Expired answers are dropped
+    from every scope, oldest first, on each lookup and insert.
+    """
+
+    def __init__(self, versions: DocumentVersions, threshold: float, ttl: float, max_entries: int):
+        self.versions = versions
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._scopes: Dict[str, _Scope] = {}
+        self._lru: "OrderedDict[int, Tuple[str, CachedAnswer]]" = OrderedDict()
+        # Insertion order is creation order, so expired entries are always at the front
+        self._by_age: "OrderedDict[int, Tuple[str, CachedAnswer]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def scope_key(self, documents: Optional[List[str]], mode: str) -> str:
+        if documents:
+            versions = self.versions.get(sorted(set(documents)))
+            docs = "|".join(f"{s}@{v}" for s, v in versions.items())
+        else:
+            docs = f"*@{self.versions.corpus_version()}"
+        return hashlib.sha256(f"{config.LLM_MODEL}|{mode}|{docs}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, scope: str, entry: CachedAnswer):
+        self._lru.pop(id(entry), None)
+        self._by_age.pop(id(entry), None)
+        cached = self._scopes.get(scope)
+        if cached is not None:
+            cached.remove(entry)
+            if not cached.entries:
+                self._scopes.pop(scope, None)
+
+    def _expire(self, now: float):
+        while self._by_age:
+            scope, entry = next(iter(self._by_age.values()))
+            if now - entry.created_at <= self.ttl:
+                break
+            self._drop(scope, entry)
+            self.expirations += 1
+
+    def get(self, scope: str, embedding: List[float]) -> Optional[Tuple[Dict, float]]:
+        """Return (answer, similarity) of the closest cached question in scope, or None."""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._expire(time.monotonic())
+            cached = self._scopes.get(scope)
+            if cached is not None:
+                scores = cached.scores(query)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry = cached.entries[best]
+                    self._lru.move_to_end(id(entry))
+                    self.hits += 1
+                    return entry.answer, float(scores[best])
+            self.misses += 1
+            return None
+
+    def put(self, scope: str, question: str, embedding: List[float], answer: Dict):
+        entry = CachedAnswer(question=question, embedding=self._normalize(embedding), answer=answer)
+        with self._lock:
+            self._expire(entry.created_at)
+            if scope not in self._scopes:
+                self._scopes[scope] = _Scope(entry.embedding.shape[0])
+            self._scopes[scope].add(entry)
+            self._lru[id(entry)] = (scope, entry)
+            self._by_age[id(entry)] = (scope, entry)
+            while len(self._lru) > self.max_entries:
+                old_scope, old_entry = next(iter(self._lru.values()))
+                self._drop(old_scope, old_entry)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+            self._lru.clear()
+            self._by_age.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "scopes": len(self._scopes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+document_versions = DocumentVersions(config.DOCUMENT_VERSIONS_PATH)
+
+answer_cache = (
+    SemanticAnswerCache(
+        document_versions,
+        threshold=config.ANSWER_CACHE_THRESHOLD,
+        ttl=config.ANSWER_CACHE_TTL,
+        max_entries=config.ANSWER_CACHE_MAX_ENTRIES
+    )
+    if config.ANSWER_CACHE_ENABLED else None
+)
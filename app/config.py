@@ -8,10 +8,79 @@ class Config:
 
     CHUNK_SIZE:int = 550
     CHUNK_OVERLAP:int = 100
+    EXTRACTION_WORKERS:int = 2
+    PDF_PAGE_WORKERS:int = 4  # shared processes scanning page ranges of large PDFs
+    PDF_PARALLEL_MIN_PAGES:int = 50  # pages per range handed to a page worker; shorter PDFs than two ranges are not split
+    PDF_TABLE_DETECTION:str = "rulings"  # "rulings" = pdfplumber only on pages with ruling lines | "all"
+    PDF_TABLE_MIN_RULINGS:int = 2  # distinct rulings a page needs each way (plus one more either way) to be scanned for tables
+    INGEST_CONCURRENCY:int = 2  # background ingestion jobs run at once, separate from query serving
+    JOBS_MAX_RETAINED:int = 1000  # finished jobs kept for GET /jobs/{id}
+    BULK_DOWNLOAD_WORKERS:int = 8  # concurrent MinIO downloads during bulk ingest
+    BULK_INDEX_BATCH_CHUNKS:int = 2048  # chunks from several files embedded and upserted together
+    BULK_MAX_INFLIGHT_FILES:int = 32  # files downloaded or extracted but not yet indexed; bounds disk and memory
+    STREAM_INGEST_MIN_BYTES:int = 50 * 1024 * 1024  # files at least this big use the streaming pipeline
+    STREAM_BATCH_CHUNKS:int = 256  # chunks per batch between streaming stages
+    STREAM_QUEUE_BATCHES:int = 4  # batches buffered between stages before the previous one waits
 
+    EMBED_BACKEND:str = "nomic"  # "nomic" | "local" | "hashing"
     EMBED_MODEL:str = "nomic-embed-text-v1"
+    NOMIC_API_URL:str = "https://api-atlas.nomic.ai"
+    LOCAL_EMBED_MODEL:str = "nomic-ai/nomic-embed-text-v1"
+    LOCAL_EMBED_RUNTIME:str = "torch"  # "torch" | "onnx"
+    VECTOR_SIZE:int = 768  # 512/256 shorten Matryoshka embeddings; needs nomic-embed-text-v1.5 (v1 is rejected at startup)
     LLM_MODEL:str = "llama3.2:1b"
+    OLLAMA_URL:str = "http://localhost:11434"
+    OLLAMA_KEEP_ALIVE:str = "30m"  # how long Ollama keeps the model loaded after a request ("-1" = forever)
+    OLLAMA_TIMEOUT:float = 120
+    OLLAMA_MAX_RETRIES:int = 2  # connection errors and 502/503/504
+    OLLAMA_POOL_SIZE:int = 10  # pooled keep-alive connections to Ollama
+    LLM_MAX_CONCURRENCY:int = 1  # generations sent to Ollama at once; match OLLAMA_NUM_PARALLEL
+    LLM_MAX_QUEUE:int = 16  # generations allowed to wait for a slot before new ones get 429
+    LLM_QUEUE_TIMEOUT:float = 30  # seconds a generation may wait for a slot before giving up with 503
+    CONTEXT_TOKEN_BUDGET:int = 2048  # max tokens of retrieved context in the prompt
+    CONTEXT_TOKENIZER:str = ""  # Hugging Face tokenizer for counting (e.g. "unsloth/Llama-3.2-1B-Instruct"); "" = ~4 chars/token
+    OLLAMA_WARM_UP:bool = True  # load LLM_MODEL at startup so the first query skips the model load
+    BATCH_LLM_CONCURRENCY:int = 4  # concurrent generations per /query/batch request
+
+    VECTOR_BACKEND:str = "qdrant"  # "qdrant" | "qdrant_embedded" | "numpy"
+    QDRANT_PATH:str = "qdrant_data"  # storage for "qdrant_embedded"
+    LOCAL_INDEX_PATH:str = "vector_index"  # storage for "numpy"
+    LOCAL_INDEX_DTYPE:str = "float32"  # "float32" | "float16"
+    LOCAL_INDEX_HNSW_THRESHOLD:int = 100_000  # build an HNSW graph (needs hnswlib) from this size, 0 = never
 
     QDRANT_HOST:str = "localhost"
     QDRANT_PORT:int = 6333
-    COLLECTION_NAME:str = "docs_chunks"
\ No newline at end of file
+    QDRANT_GRPC_PORT:int = 6334
+    QDRANT_PREFER_GRPC:bool = True
+    UPSERT_BATCH_SIZE:int = 256
+    UPSERT_PARALLEL:int = 4
+    SEARCH_TOP_K:int = 4
+    RETRIEVAL_MODE:str = "hybrid"  # "hybrid" | "dense" | "keyword"
+    HYBRID_CANDIDATES:int = 20  # hits taken from each retriever before fusion
+    RRF_K:int = 60
+    SPARSE_INDEX_ENABLED:bool = True
+    SPARSE_INDEX_PATH:str = "cache/bm25.sqlite"
+    BM25_MAX_DF_RATIO:float = 0.5  # query terms in more than this share of chunks are skipped (the rarest term is always kept)
+    PER_DOCUMENT_TOP_K:int = 0  # > 0 caps hits per selected document instead of a global top-k
+    COLLECTION_NAME:str = "docs_chunks"
+    # Storage mode is applied when the collection is created; call reset_collection() after changing it
+    VECTOR_QUANTIZATION:str = "none"  # "none" | "scalar" | "binary"
+    VECTOR_ON_DISK:bool = False  # keep full-precision originals on disk, quantized copies in RAM
+    QUANTIZATION_RESCORE:bool = True
+    QUANTIZATION_OVERSAMPLING:float = 2.0
+
+    EMBED_BATCH_SIZE:int = 64
+    EMBED_MAX_WORKERS:int = 4
+    EMBED_MAX_RETRIES:int = 3
+    EMBED_RETRY_BACKOFF:float = 1.0
+
+    EMBED_CACHE_ENABLED:bool = True
+    EMBED_CACHE_PATH:str = "cache/embeddings.sqlite"
+    EMBED_CACHE_MAX_ENTRIES:int = 200_000
+    QUERY_CACHE_MAX_ENTRIES:int = 10_000
+
+    ANSWER_CACHE_ENABLED:bool = True
+    ANSWER_CACHE_THRESHOLD:float = 0.95  # cosine similarity for a paraphrase to reuse an answer
+    ANSWER_CACHE_TTL:float = 3600  # seconds
+    ANSWER_CACHE_MAX_ENTRIES:int = 5000
+    DOCUMENT_VERSIONS_PATH:str = "cache/document_versions.sqlite"  # current ETag of each indexed document
@@ -0,0 +1,172 @@
+import re
+import math
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app.config import Config
+
+config = Config()
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\S+")
+# Word runs and single punctuation marks: a lower bound on BPE tokens for JSON-like text
+PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class TokenCounter:
+    """
+    Counts tokens with the LLM's tokenizer when CONTEXT_TOKENIZER names a
+    Hugging Face tokenizer and the `tokenizers` package is installed.
+
+    Otherwise it estimates: the larger of ~4 characters per token (close for
+    English prose) and the number of words plus punctuation marks. The second
+    bound matters for table chunks, whose JSON rows spend a token on nearly
+    every quote, colon and comma and would be undercounted by characters alone.
+    """
+
+    def __init__(self, name: str = config.CONTEXT_TOKENIZER):
+        self.name = "estimate"
+        self._tokenizer = None
+        if name:
+            try:
+                from tokenizers import Tokenizer
+                self._tokenizer = Tokenizer.from_pretrained(name)
+                self.name = name
+            except Exception as e:
+                logger.warning(f"⚠️ Could not load tokenizer '{name}', estimating tokens from characters: {e}")
+
+    def count(self, text: str) -> int:
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        return max(math.ceil(len(text) / 4), sum(1 for _ in PIECE_PATTERN.finditer(text)))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self._tokenizer is not None:
+            encoding = self._tokenizer.encode(text, add_special_tokens=False)
+            if len(encoding.ids) <= max_tokens:
+                return text
+            return text[:encoding.offsets[max_tokens - 1][1]]
+        end = max_tokens * 4
+        for i, piece in enumerate(PIECE_PATTERN.finditer(text[:end]), 1):
+            if i == max_tokens:
+                end = piece.end()
+                break
+        return text[:end]
+
+
+def trim_overlap(previous: str, current: str, max_words: int) -> str:
+    """
+    Drop the start of `current` that repeats the end of `previous`: adjacent
+    chunks from the splitter share up to CHUNK_OVERLAP tokens.
+    """
+    prev_words = previous.split()
+    matches = list(WORD_PATTERN.finditer(current))
+    for n in range(min(len(prev_words), len(matches), max_words), 0, -1):
+        if prev_words[-n:] == [m.group() for m in matches[:n]]:
+            return current[matches[n - 1].end():].lstrip()
+    return current
+
+
+@dataclass
+class PackedChunk:
+    match: object
+    text: str
+    tokens: int
+
+
+@dataclass
+class PackedContext:
+    chunks: List[PackedChunk] = field(default_factory=list)
+    budget: int = 0
+    dropped: int = 0
+    overlap_tokens_trimmed: int = 0
+    truncated: bool = False
+    tokenizer: str = ""
+
+    @property
+    def tokens(self) -> int:
+        return sum(c.tokens for c in self.chunks)
+
+    def usage(self) -> Dict:
+        return {
+            "context_tokens": self.tokens,
+            "budget": self.budget,
+            "chunks_used": len(self.chunks),
+            "chunks_dropped": self.dropped,
+            "overlap_tokens_trimmed": self.overlap_tokens_trimmed,
+            "truncated": self.truncated,
+            "tokenizer": self.tokenizer,
+        }
+
+
+class ContextPacker:
+    """
+    Fills a token budget with retrieved chunks in relevance order.
+
+    Chunks that no longer fit are skipped so smaller, less relevant ones can
+    still use the remaining space. When two consecutive chunks of the same
+    document version are both selected, the later one loses the text it
+    repeats from the earlier one. Only the top chunk is ever cut short, and
+    only if it alone exceeds the budget.
+    """
+
+    def __init__(self, budget: int = config.CONTEXT_TOKEN_BUDGET, counter: Optional[TokenCounter] = None):
+        self.budget = budget
+        self.counter = counter or TokenCounter()
+        # Overlap is measured in tokens; a token is rarely more than one word
+        self.max_overlap_words = config.CHUNK_OVERLAP
+
+    @staticmethod
+    def _position(payload: Dict):
+        if payload.get("chunk_index") is None:
+            return None
+        return payload.get("source"), payload.get("doc_version"), payload["chunk_index"]
+
+    def pack(self, matches: List) -> PackedContext:
+        packed = PackedContext(budget=self.budget, tokenizer=self.counter.name)
+        selected: Dict[tuple, PackedChunk] = {}
+
+        for match in matches:
+            payload = match.payload or {}
+            text = payload.get("text", "")
+            full_tokens = self.counter.count(text)
+            position = self._position(payload)
+
+            if position is not None:
+                source, version, index = position
+                previous = selected.get((source, version, index - 1))
+                if previous is not None:
+                    text = trim_overlap(previous.match.payload.get("text", ""), text, self.max_overlap_words)
+            tokens = self.counter.count(text)
+            overlap = full_tokens - tokens
+
+            remaining = self.budget - packed.tokens
+            if tokens > remaining:
+                if packed.chunks:
+                    packed.dropped += 1
+                    continue
+                text = self.counter.truncate(text, remaining)
+                tokens = self.counter.count(text)
+                packed.truncated = True
+
+            chunk = PackedChunk(match=match, text=text, tokens=tokens)
+            packed.chunks.append(chunk)
+            packed.overlap_tokens_trimmed += overlap
+
+            if position is not None:
+                selected[position] = chunk
+                # A following chunk selected earlier (it was more relevant) repeats our tail
+                following = selected.get((source, version, index + 1))
+                if following is not None:
+                    trimmed = trim_overlap(text, following.text, self.max_overlap_words)
+                    trimmed_tokens = self.counter.count(trimmed)
+                    packed.overlap_tokens_trimmed += following.tokens - trimmed_tokens
+                    following.text, following.tokens = trimmed, trimmed_tokens
+
+        return packed
+
+
+context_packer = ContextPacker()
@@ -0,0 +1,191 @@
+import os
+import re
+import asyncio
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from typing import List
+from dotenv import load_dotenv
+import httpx
+import numpy as np
+from app.config import Config
+
+load_dotenv()
+config = Config()
+
+
+NOMIC_NATIVE_DIM = 768
+# Models trained to be shortened; others lose most of their quality when truncated
+MATRYOSHKA_MODELS = ("nomic-embed-text-v1.5",)
+
+
+def supports_matryoshka(model: str) -> bool:
+    return model.rsplit("/", 1)[-1].lower() in MATRYOSHKA_MODELS
+
+
+def _require_matryoshka(model: str):
+    if not supports_matryoshka(model):
+        raise ValueError(
+            f"❌ VECTOR_SIZE={config.VECTOR_SIZE} shortens embeddings, which needs a Matryoshka model "
+            f"(one of {', '.join(MATRYOSHKA_MODELS)}); '{model}' only produces full-size vectors."
+        )
+
+
+def matryoshka_truncate(vectors: np.ndarray, dim: int, eps: float = 1e-5) -> np.ndarray:
+    """
+    Shorten raw (unnormalized) Matryoshka embeddings to `dim`: layer norm over
+    the full vector, keep the first `dim` values, then L2-normalize.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    mean = vectors.mean(axis=1, keepdims=True)
+    var = vectors.var(axis=1, keepdims=True)
+    vectors = ((vectors - mean) / np.sqrt(var + eps))[:, :dim]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class Embedder(ABC):
+    """
+    Common interface for embedding backends.
+
+    `task_type` follows Nomic's convention: "search_document" for chunks that
+    are stored, "search_query" for questions that are searched with.
+    """
+    name: str = "embedder"
+
+    @abstractmethod
+    def embed(self, texts: List[str], task_type: str = "search_document") -> List[List[float]]:
+        """Return one vector per text."""
+
+    async def aembed(self, texts: List[str], task_type: str = "search_document") -> List[List[float]]:
+        # Default for local backends: run the blocking call in a worker thread
+        return await asyncio.to_thread(self.embed, texts, task_type)
+
+
+class NomicEmbedder(Embedder):
+    """
+    Remote embeddings from the Nomic Atlas API. When VECTOR_SIZE is below the
+    model's native size, the API is asked for that `dimensionality` and applies
+    the Matryoshka layer norm and truncation itself.
+    """
+
+    def __init__(self, model: str):
+        from nomic import embed
+        import nomic
+
+        # Login lazily, so nothing touches the network unless this backend is selected
+        nomic.login(token=os.getenv("NOMIC_API_KEY"))
+        self._embed = embed
+        self._http = None
+        self.model = model
+        self.dimensionality = config.VECTOR_SIZE if config.VECTOR_SIZE < NOMIC_NATIVE_DIM else None
+        self.name = f"nomic:{model}" + (f"@{self.dimensionality}" if self.dimensionality else "")
+
+    def embed(self, texts: List[str], task_type: str = "search_document") -> List[List[float]]:
+        response = self._embed.text(
+            texts=texts, model=self.model, task_type=task_type, dimensionality=self.dimensionality
+        )
+        return response["embeddings"]
+
+    async def aembed(self, texts: List[str], task_type: str = "search_document") -> List[List[float]]:
+        # The nomic SDK is blocking, so the async path calls the same REST endpoint directly
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=config.NOMIC_API_URL,
+                headers={"Authorization": f"Bearer {os.getenv('NOMIC_API_KEY')}"},
+                timeout=60
+            )
+        payload = {"model": self.model, "texts": texts, "task_type": task_type}
+        if self.dimensionality:
+            payload["dimensionality"] = self.dimensionality
+        res = await self._http.post("/v1/embedding/text", json=payload)
+        res.raise_for_status()
+        return res.json()["embeddings"]
+
+
+class LocalEmbedder(Embedder):
+    """
+    Local CPU embeddings through sentence-transformers.
+
+    The default model is the open-weights release of the Nomic model used by the
+    API backend, so vectors stay comparable. Set LOCAL_EMBED_RUNTIME to "onnx"
+    to run it with ONNX Runtime instead of PyTorch. When VECTOR_SIZE is below
+    the model's output size, vectors are shortened the way Nomic's Matryoshka
+    models are meant to be: layer norm, truncate, then L2-normalize.
+    """
+
+    def __init__(self, model: str, runtime: str = "torch"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError("❌ EMBED_BACKEND='local' requires the sentence-transformers package.") from e
+
+        self.model = SentenceTransformer(model, device="cpu", backend=runtime, trust_remote_code=True)
+        native = self.model.get_sentence_embedding_dimension()
+        self.dim = config.VECTOR_SIZE if native and config.VECTOR_SIZE < native else None
+        self.name = f"local:{model}" + (f"@{self.dim}" if self.dim else "")
+        # Nomic models expect the task as a text prefix
+        self._prefixed = "nomic" in model.lower()
+
+    def embed(self, texts: List[str], task_type: str = "search_document") -> List[List[float]]:
+        if self._prefixed:
+            texts = [f"{task_type}: {t}" for t in texts]
+        vectors = self.model.encode(
+            texts, batch_size=config.EMBED_BATCH_SIZE, normalize_embeddings=self.dim is None
+        )
+        if self.dim is not None:
+            vectors = matryoshka_truncate(vectors, self.dim)
+        return vectors.tolist()
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic feature-hashing embedder for tests and offline benchmarks.
+    Texts sharing words get similar vectors, but there is no semantic model behind it.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def _vector(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vec[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed(self, texts: List[str], task_type: str = "search_document") -> List[List[float]]:
+        return [self._vector(t) for t in texts]
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder() -> Embedder:
+    """
+    Return the process-wide embedder selected by Config.EMBED_BACKEND. A
+    VECTOR_SIZE below the model's output size is rejected here, at startup,
+    unless the model supports Matryoshka truncation.
+    """
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            backend = config.EMBED_BACKEND.lower()
+            if backend == "nomic":
+                if config.VECTOR_SIZE < NOMIC_NATIVE_DIM:
+                    _require_matryoshka(config.EMBED_MODEL)
+                _embedder = NomicEmbedder(config.EMBED_MODEL)
+            elif backend == "local":
+                embedder = LocalEmbedder(config.LOCAL_EMBED_MODEL, config.LOCAL_EMBED_RUNTIME)
+                if embedder.dim is not None:
+                    _require_matryoshka(config.LOCAL_EMBED_MODEL)
+                _embedder = embedder
+            elif backend == "hashing":
+                _embedder = HashingEmbedder(config.VECTOR_SIZE)
+            else:
+                raise ValueError(f"Unknown EMBED_BACKEND: {config.EMBED_BACKEND}")
+            print(f"[🧩] Using embedder: {_embedder.name}")
+    return _embedder
@@ -1,22 +1,158 @@
-import os
-from typing import List, Dict, Any
-from dotenv import load_dotenv
-from nomic import embed
-import nomic
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from app.config import Config
+from app.embedders import get_embedder
+from app.embedding_cache import embedding_cache, query_embedding_cache
 
-load_dotenv()
 config = Config()
 
-# Login to nomic
-nomic.login(token=os.getenv("NOMIC_API_KEY"))
+def _embed_batch(batch: List[str], batch_idx: int, task_type: str = "search_document") -> List[Optional[List[float]]]:
+    """
+    Embed one batch of texts, retrying with exponential backoff on failure.
+    A batch that still fails after EMBED_MAX_RETRIES yields None for each text.
+    """
+    for attempt in range(1, config.EMBED_MAX_RETRIES + 1):
+        try:
+            embeddings = get_embedder().embed(batch, task_type=task_type)
+            if len(embeddings) != len(batch):
+                raise ValueError(f"{len(embeddings)} embeddings for {len(batch)} texts")
+            return embeddings
+        except Exception as e:
+            if attempt == config.EMBED_MAX_RETRIES:
+                print(f"❌ Embedding batch {batch_idx} failed after {attempt} attempts: {e}")
+                return [None] * len(batch)
+            delay = config.EMBED_RETRY_BACKOFF * (2 ** (attempt - 1))
+            print(f"⚠️ Embedding batch {batch_idx} failed (attempt {attempt}): {e} → retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def embed_texts(texts: List[str], task_type: str = "search_document") -> List[Optional[List[float]]]:
+    """
+    Embed texts, serving byte-identical chunks from the embedding cache and
+    sending only the misses to the embedding API.
+    Embeddings are returned in input order, VECTOR_SIZE long, with None
+    in place of texts whose batch failed.
+    """
+    if not texts:
+        return []
+    if embedding_cache is None:
+        return _embed_uncached(texts, task_type)
+
+    cache_model = f"{get_embedder().name}/{task_type}"
+    embeddings = embedding_cache.get_many(cache_model, texts)
+    missing = [i for i, emb in enumerate(embeddings) if emb is None]
+    print(f"[🗄️ Cache] {len(texts) - len(missing)}/{len(texts)} chunks served from cache | {embedding_cache.stats()}")
+
+    if missing:
+        fresh = _embed_uncached([texts[i] for i in missing], task_type)
+        for i, emb in zip(missing, fresh):
+            embeddings[i] = emb
+        embedding_cache.put_many(cache_model, [texts[i] for i in missing], fresh)
+    return embeddings
+
+def _embed_query_uncached(text: str) -> List[float]:
+    embedding = embed_texts([" ".join(text.split())], task_type="search_query")[0]
+    if embedding is None:
+        raise RuntimeError("❌ Embedding API failed for query.")
+    return embedding
+
+def embed_query(text: str) -> List[float]:
+    """
+    Embed a single query string, raising if the embedding API fails.
+    Repeated and concurrent identical questions are served by the in-process query cache.
+    """
+    return query_embedding_cache.get_or_compute(text, _embed_query_uncached)
+
+async def _aembed_query_uncached(text: str) -> List[float]:
+    text = " ".join(text.split())
+    embedder = get_embedder()
+    cache_model = f"{embedder.name}/search_query"
+    if embedding_cache is not None:
+        cached = (await asyncio.to_thread(embedding_cache.get_many, cache_model, [text]))[0]
+        if cached is not None:
+            return cached
+
+    try:
+        embedding = (await embedder.aembed([text], task_type="search_query"))[0]
+    except Exception as e:
+        raise RuntimeError(f"❌ Embedding API failed for query: {e}")
+
+    if embedding_cache is not None:
+        await asyncio.to_thread(embedding_cache.put_many, cache_model, [text], [embedding])
+    return embedding
+
+async def aembed_query(text: str) -> List[float]:
+    """
+    Async embed_query for the API path: cache lookups run off the event loop
+    and the embedder is called through its async client.
+    """
+    return await query_embedding_cache.aget_or_compute(text, _aembed_query_uncached)
+
+async def aembed_queries(texts: List[str]) -> List[List[float]]:
+    """
+    Embed many questions with at most one embedder call: LRU and disk-cache hits
+    are filled in first, and all remaining questions go out as a single batch.
+    """
+    results: List[Optional[List[float]]] = [query_embedding_cache.peek(t) for t in texts]
+    missing = [i for i, emb in enumerate(results) if emb is None]
+    if not missing:
+        return results
 
-def embed_nodes(nodes: List[Any]) -> List[Dict[str, Any]]:
+    embedder = get_embedder()
+    cache_model = f"{embedder.name}/search_query"
+    cleaned = {i: " ".join(texts[i].split()) for i in missing}
+
+    if embedding_cache is not None:
+        cached = await asyncio.to_thread(embedding_cache.get_many, cache_model, [cleaned[i] for i in missing])
+        for i, emb in zip(missing, cached):
+            if emb is not None:
+                results[i] = emb
+                query_embedding_cache.put(texts[i], results[i])
+        missing = [i for i in missing if results[i] is None]
+
+    if missing:
+        # Identical questions in one batch are only sent once
+        unique = list(dict.fromkeys(cleaned[i] for i in missing))
+        try:
+            fresh = await embedder.aembed(unique, task_type="search_query")
+        except Exception as e:
+            raise RuntimeError(f"❌ Embedding API failed for query batch: {e}")
+        if embedding_cache is not None:
+            await asyncio.to_thread(embedding_cache.put_many, cache_model, unique, fresh)
+        by_text = dict(zip(unique, fresh))
+        for i in missing:
+            results[i] = by_text[cleaned[i]]
+            query_embedding_cache.put(texts[i], results[i])
+    return results
+
+def _embed_uncached(texts: List[str], task_type: str = "search_document") -> List[Optional[List[float]]]:
+    """
+    Embed texts in batches of EMBED_BATCH_SIZE, keeping at most EMBED_MAX_WORKERS
+    batches in flight.
     """
-    Given a list of nodes (each with .text and .metadata), get embeddings from Nomic API.
+    size = max(1, config.EMBED_BATCH_SIZE)
+    batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, config.EMBED_MAX_WORKERS)) as pool:
+        # map() yields in submission order, so the output lines up with the input
+        results = list(pool.map(_embed_batch, batches, range(len(batches)), [task_type] * len(batches)))
+    elapsed = time.perf_counter() - start
+
+    embeddings = [emb for batch in results for emb in batch]
+    done = sum(1 for emb in embeddings if emb is not None)
+    rate = done / elapsed if elapsed > 0 else float("inf")
+    print(f"[⚡] Embedded {done}/{len(texts)} chunks in {len(batches)} batch(es) → {elapsed:.2f}s ({rate:.1f} chunks/sec)")
+    return embeddings
+
+def embed_nodes(nodes: List[Any]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Given a list of nodes (each with .text and .metadata), get embeddings from the configured embedder.
 
     Returns:
-        List of dicts with 'embedding', 'text', and 'metadata' keys.
+        (results, failed): a list of dicts with 'embedding', 'text', and 'metadata'
+        keys, and the number of non-blank nodes whose embedding batch failed.
     """
     if not nodes or not all(hasattr(n, "text") for n in nodes):
         raise ValueError("Each node must have a 'text' attribute.")
@@ -29,33 +165,32 @@ def embed_nodes(nodes: List[Any]) -> List[Dict[str, Any]]:
 
     if not texts:
         print("⚠️ No valid text chunks found for embedding.")
-        return []
+        return [], 0
 
-    try:
-        response = embed.text(
-            texts=texts,
-            model=config.EMBED_MODEL
-        )
-        embeddings = response["embeddings"]
-    except Exception as e:
-        raise RuntimeError(f"❌ Embedding API failed: {e}")
+    embeddings = embed_texts(texts)
 
     # Sanity check
     if len(embeddings) != len(filtered_nodes):
         raise ValueError(f"❌ Mismatch: {len(embeddings)} embeddings vs {len(filtered_nodes)} nodes")
 
+    if not any(emb is not None for emb in embeddings):
+        raise RuntimeError("❌ Embedding API failed for every batch.")
+
     results = []
     for node, emb in zip(filtered_nodes, embeddings):
+        if emb is None:
+            continue
         results.append({
             "embedding": emb,
             "text": node.text,
             "metadata": node.metadata
         })
 
-    print(f"[✅] Embedded {len(results)} chunks.")
+    failed = len(filtered_nodes) - len(results)
+    print(f"[✅] Embedded {len(results)} chunks." + (f" ❌ {failed} failed." if failed else ""))
     for r in results[:2]:
         print(f"[🧠 Vector] Text: {r['text'][:40]} | Embedding: {len(r['embedding'])} | Meta: {r['metadata']}")
-    return results
+    return results, failed
 
 # ✅ Standalone test
 if __name__ == "__main__":
@@ -71,7 +206,7 @@ if __name__ == "__main__":
     ]
 
     try:
-        results = embed_nodes(test_nodes)
+        results, failed = embed_nodes(test_nodes)
         for r in results:
             print(f"\n📌 Text: {r['text'][:40]}...")
             print(f"🔖 Metadata: {r['metadata']}")
@@ -2,7 +2,7 @@ import os
 import pandas as pd
 import chardet
 import csv
-from typing import List
+from typing import Iterator, List
 from llama_index.core import Document
 from llama_index.core.node_parser import SentenceSplitter
 import logging
@@ -15,6 +15,9 @@ config = Config()
 
 logging.basicConfig(level=logging.INFO)
 
+# Rows per pd.read_csv chunk, and most rows chunked together, when streaming a CSV
+STREAM_ROWS = 10_000
+
 class ExtractCSV:
     
     @staticmethod
@@ -47,23 +50,59 @@ class ExtractCSV:
             if row.isnull().all():
                 if current_table:
                     # Current table -> Dataframe
-                    df_raw = pd.DataFrame(current_table).dropna(how='all', axis=1)
-                    df_raw.columns = df_raw.iloc[0]  # First row = header
-                    df = df_raw[1:].reset_index(drop=True)
-                    tables.append(df)
+                    tables.append(ExtractCSV._frame(current_table))
                     current_table = []
             else:
                 current_table.append(row.tolist())
 
         # Last table
         if current_table:
-            df_raw = pd.DataFrame(current_table).dropna(how='all', axis=1)
-            df_raw.columns = df_raw.iloc[0]
-            df = df_raw[1:].reset_index(drop=True)
-            tables.append(df)
+            tables.append(ExtractCSV._frame(current_table))
 
         return tables
 
+    @staticmethod
+    def _frame(rows: List[list]) -> pd.DataFrame:
+        """Raw rows of one table (header first) -> DataFrame with that header."""
+        df_raw = pd.DataFrame(rows).dropna(how='all', axis=1)
+        df_raw.columns = df_raw.iloc[0]  # First row = header
+        return df_raw[1:].reset_index(drop=True)
+
+    @staticmethod
+    def _table_nodes(splitter: SentenceSplitter, source: str, ext: str, csv_df: pd.DataFrame,
+                     table_id: int, start: int = 0) -> List:
+        """Chunk one table (or a slice of it); node indexes are numbered from `start`."""
+        # Convert DataFrame to CSV string
+        csv_str = csv_df.to_csv(index=False)
+        # Create a Document object directly
+        document = Document(text=csv_str)
+        if not document.text.strip():
+            return []
+
+        nodes = splitter.get_nodes_from_documents([document])
+        for i, node in enumerate(nodes, start):
+            lines_in_chunk = node.text.splitlines()
+            try:
+                first_idx = int(lines_in_chunk[0].split(":", 1)[0])
+                last_idx = int(lines_in_chunk[-1].split(":", 1)[0])
+                row_range = f"{first_idx} - {last_idx}"
+            except Exception as e:
+                logging.warning(f"Could not determine row range: {e}")
+                row_range = "unknown"
+
+            metadata = generate_metadata_csv_excel(
+                source=source,
+                index=i,
+                max_index=start + len(nodes),
+                file_format=ext,
+                sheet_name=None,
+                table_id=f"table_{table_id}",
+                headers=csv_df.columns.tolist(),
+                row_range=row_range
+            )
+            node.metadata = metadata
+        return nodes
+
     @staticmethod
     def extract_and_chunk(file_path: str) -> List:
         """
@@ -86,49 +125,91 @@ class ExtractCSV:
             logging.error(f"Error reading CSV file: {e}")
             return []
 
+        splitter = SentenceSplitter(
+            chunk_size=config.CHUNK_SIZE,
+            chunk_overlap=config.CHUNK_OVERLAP
+        )
         all_nodes = []
         for table_id, csv_df in enumerate(tables):
             try:
-                # Convert DataFrame to CSV string
-                csv_str = csv_df.to_csv(index=False)
-                # Create a Document object directly
-                document = Document(text=csv_str)
-                if not document.text.strip():
-                    continue
-
-                splitter = SentenceSplitter(
-                    chunk_size=config.CHUNK_SIZE,
-                    chunk_overlap=config.CHUNK_OVERLAP
-                )
-                nodes = splitter.get_nodes_from_documents([document])
-
-                for i, node in enumerate(nodes):
-                    lines_in_chunk = node.text.splitlines()
-                    try:
-                        first_idx = int(lines_in_chunk[0].split(":", 1)[0])
-                        last_idx = int(lines_in_chunk[-1].split(":", 1)[0])
-                        row_range = f"{first_idx} - {last_idx}"
-                    except Exception as e:
-                        logging.warning(f"Could not determine row range: {e}")
-                        row_range = "unknown"
-
-                    metadata = generate_metadata_csv_excel(
-                        source=source,
-                        index=i,
-                        max_index=len(nodes),
-                        file_format=ext,
-                        sheet_name=None,
-                        table_id=f"table_{table_id}",
-                        headers=csv_df.columns.tolist(),
-                        row_range=row_range
-                    )
-                    node.metadata = metadata
-
-                all_nodes.extend(nodes)
+                all_nodes.extend(ExtractCSV._table_nodes(splitter, source, ext, csv_df, table_id))
             except Exception as e:
                 logging.error(f"Failed processing table {table_id} in '{file_path}': {e}")
 
         return all_nodes
+
+    @staticmethod
+    def iter_chunks(file_path: str) -> Iterator:
+        """
+        Streaming form of extract_and_chunk: reads the CSV with
+        pd.read_csv(chunksize=STREAM_ROWS) and yields chunks for every
+        STREAM_ROWS rows of a table, so large files are never loaded whole.
+        Tables are still separated by blank rows, and each slice is chunked
+        with its table's header, as extract_and_chunk does. Errors are handled
+        the same way too: an unreadable file is logged and stops the stream,
+        a table that fails to chunk is logged and skipped.
+        """
+        print(f"📂 Streaming chunks from: {file_path}")
+        ext = os.path.splitext(file_path)[-1][1:].lower()
+        source = os.path.basename(file_path)
+
+        if os.path.getsize(file_path) == 0:
+            logging.warning(f"Skipping empty CSV file: {file_path}")
+            return
+
+        try:
+            encoding = ExtractCSV.detect_encoding(file_path)
+            delimiter = ExtractCSV.detect_delimiter(file_path, encoding)
+        except Exception as e:
+            logging.error(f"Error reading CSV file: {e}")
+            return
+
+        splitter = SentenceSplitter(
+            chunk_size=config.CHUNK_SIZE,
+            chunk_overlap=config.CHUNK_OVERLAP
+        )
+        table_id, emitted = 0, 0  # emitted = chunks already yielded for the current table
+        header, rows = None, []
+
+        def flush():
+            nonlocal emitted
+            if header is None or not rows:
+                return []
+            try:
+                nodes = ExtractCSV._table_nodes(splitter, source, ext, ExtractCSV._frame([header] + rows), table_id, emitted)
+            except Exception as e:
+                logging.error(f"Failed processing table {table_id} in '{file_path}': {e}")
+                nodes = []
+            emitted += len(nodes)
+            rows.clear()
+            return nodes
+
+        # dtype=str keeps values as written; inferring per chunk would turn 48 into 48.0
+        # in any chunk that happens to contain a blank row
+        try:
+            reader = pd.read_csv(
+                file_path, encoding=encoding, delimiter=delimiter,
+                skip_blank_lines=False, header=None, chunksize=STREAM_ROWS, dtype=str
+            )
+            with reader:
+                for frame in reader:
+                    for row in frame.itertuples(index=False, name=None):
+                        if all(pd.isna(value) for value in row):
+                            # Blank row: the current table ends
+                            yield from flush()
+                            if header is not None:
+                                table_id, emitted, header = table_id + 1, 0, None
+                        elif header is None:
+                            header = list(row)
+                        else:
+                            rows.append(list(row))
+                            if len(rows) >= STREAM_ROWS:
+                                yield from flush()
+        except Exception as e:
+            # Like extract_and_chunk, a file that cannot be read yields nothing more
+            logging.error(f"Error reading CSV file: {e}")
+            return
+        yield from flush()
     
 if __name__ == "__main__":
     nodes = ExtractCSV.extract_and_chunk("./app/documents/advertising.csv")
@@ -1,9 +1,16 @@
+import io
 import os
 import fitz
 import re
 import pandas as pd
 import json
-from typing import List
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from typing import BinaryIO, Iterator, List, Union
 import pdfplumber
 import logging
 from llama_index.core import Document
@@ -15,125 +22,313 @@ from .helper import generate_metadata_pdf
 config = Config()
 logging.basicConfig(level=logging.INFO)
 
+def _open_fitz(source: Union[str, bytes]):
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def _open_plumber(source: Union[str, bytes]):
+    if isinstance(source, (bytes, bytearray)):
+        return pdfplumber.open(io.BytesIO(source))
+    return pdfplumber.open(source)
+
+def _distinct(positions: List[float], tolerance: float) -> int:
+    """Number of positions left after merging those within `tolerance` of each other."""
+    count, last = 0, None
+    for position in sorted(positions):
+        if last is None or position - last > tolerance:
+            count += 1
+        last = position
+    return count
+
+def count_rulings(page, min_length: float = 10.0, tolerance: float = 1.0) -> tuple[int, int]:
+    """
+    Count the distinct rows (y positions) of horizontal rulings and columns
+    (x positions) of vertical rulings drawn on a page: straight line segments
+    plus the edges of rectangles and axis-aligned quads (thin ones count as
+    one line). Rulings shorter than `min_length` points, slanted lines or
+    quads, and the edges of fill-only boxes (backgrounds, not borders) are
+    not counted.
+    """
+    rows, columns = [], []
+    for path in page.get_drawings():
+        stroked = "s" in (path.get("type") or "")
+        for item in path["items"]:
+            if item[0] == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.y - p2.y) <= tolerance and abs(p1.x - p2.x) >= min_length:
+                    rows.append(p1.y)
+                elif abs(p1.x - p2.x) <= tolerance and abs(p1.y - p2.y) >= min_length:
+                    columns.append(p1.x)
+            elif item[0] in ("re", "qu"):
+                if item[0] == "qu":
+                    quad = item[1]
+                    if abs(quad.ul.y - quad.ur.y) > tolerance or abs(quad.ul.x - quad.ll.x) > tolerance:
+                        continue
+                rect = item[1] if item[0] == "re" else item[1].rect
+                if rect.height <= tolerance and rect.width >= min_length:
+                    rows.append(rect.y0)
+                elif rect.width <= tolerance and rect.height >= min_length:
+                    columns.append(rect.x0)
+                elif stroked and rect.width >= min_length and rect.height >= min_length:
+                    rows.extend((rect.y0, rect.y1))
+                    columns.extend((rect.x0, rect.x1))
+    return _distinct(rows, tolerance), _distinct(columns, tolerance)
+
+def likely_has_table(page) -> bool:
+    """
+    Cheap pre-check before pdfplumber. With its default "lines" strategy,
+    pdfplumber only finds tables whose cells are bounded by ruling lines and
+    drops single-cell ones, so a page needs at least PDF_TABLE_MIN_RULINGS
+    distinct rulings each way and one more in either direction (a 2-cell grid);
+    a lone page border or boxed callout is not enough.
+    """
+    if config.PDF_TABLE_DETECTION == "all":
+        return True
+    horizontal, vertical = count_rulings(page)
+    minimum = config.PDF_TABLE_MIN_RULINGS
+    return min(horizontal, vertical) >= minimum and max(horizontal, vertical) > minimum
+
+def iter_page_scans(source: Union[str, bytes], start: int = 0, end: int = None,
+                    text: bool = True, tables: bool = True) -> Iterator[dict]:
+    """
+    Walk pages [start, end) once, yielding text and image counts from PyMuPDF.
+    Only pages with enough ruling lines are handed to pdfplumber for tables.
+    Callers that need no text or no tables can turn either part off.
+    """
+    plumber = None
+    with _open_fitz(source) as doc:
+        end = doc.page_count if end is None else end
+        try:
+            for index in range(start, end):
+                page = doc[index]
+                scan = {"page_num": index + 1, "text": "", "images": 0, "tables": [], "table_scanned": False}
+                try:
+                    if text:
+                        scan["text"] = page.get_text().strip()
+                except Exception as e:
+                    logging.error(f"[ExtractPDF] Text extraction failed on page {index + 1}: {e}")
+                try:
+                    scan["images"] = len(page.get_images(full=True))
+                except Exception as e:
+                    logging.warning(f"[ExtractPDF] Image detection failed on page {index + 1}: {e}")
+                try:
+                    if tables and likely_has_table(page):
+                        # pdfplumber is only opened once some page needs it
+                        plumber = plumber or _open_plumber(source)
+                        scan["table_scanned"] = True
+                        plumber_page = plumber.pages[index]
+                        scan["tables"] = plumber_page.extract_tables()
+                        # Drop the page's parsed objects so long documents don't pile them up
+                        if hasattr(plumber_page, "close"):
+                            plumber_page.close()
+                except Exception as e:
+                    logging.warning(f"[ExtractPDF] Table extraction failed on page {index + 1}: {e}")
+                yield scan
+        finally:
+            if plumber is not None:
+                plumber.close()
+
+def scan_page_range(source: Union[str, bytes], start: int, end: int) -> List[dict]:
+    """List form of iter_page_scans; top-level so it can run in a worker process."""
+    return list(iter_page_scans(source, start, end))
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    """Process pool for page ranges, started on first use and reused for every PDF."""
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(
+                max_workers=config.PDF_PAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _page_pool
+
+def _discard_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=False, cancel_futures=True)
+            _page_pool = None
+
+def shutdown_page_pool():
+    _discard_page_pool()
+
+def page_count(source: Union[str, bytes]) -> int:
+    with _open_fitz(source) as doc:
+        return doc.page_count
+
+def page_workers(pages: int) -> int:
+    """How many page-pool workers a PDF of `pages` pages is worth splitting across."""
+    return min(config.PDF_PAGE_WORKERS, pages // max(1, config.PDF_PARALLEL_MIN_PAGES))
+
+def splits_pages(source: Union[str, bytes]) -> bool:
+    """Whether a PDF is long enough to be scanned on the page pool (False if it can't be opened)."""
+    try:
+        return page_workers(page_count(source)) > 1
+    except Exception:
+        return False
+
+def _spill(data: bytes) -> str:
+    """Write an in-memory PDF to a temp file, so page workers get a path instead of the bytes."""
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="pages_")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+def iter_page_scans_parallel(source: Union[str, bytes], pages: int, workers: int) -> Iterator[dict]:
+    """
+    iter_page_scans on the shared page pool: ranges of PDF_PARALLEL_MIN_PAGES
+    pages are scanned by up to `workers` processes, with as many more queued,
+    and yielded in page order, so a streaming caller holds only a few ranges.
+    In-memory PDFs are written to a temp file once rather than pickled into
+    every range. If the pool breaks, the remaining pages are scanned here.
+    """
+    step = max(1, config.PDF_PARALLEL_MIN_PAGES)
+    ranges = deque((start, min(start + step, pages)) for start in range(0, pages, step))
+    window = deque()  # (future, end page) in page order
+    next_page = 0
+    spilled = _spill(source) if isinstance(source, (bytes, bytearray)) else None
+    path = spilled or source
+    try:
+        pool = _get_page_pool()
+        while ranges or window:
+            while ranges and len(window) < 2 * workers:
+                start, end = ranges.popleft()
+                window.append((pool.submit(scan_page_range, path, start, end), end))
+            future, end = window.popleft()
+            yield from future.result()
+            next_page = end
+    except BrokenProcessPool as e:
+        logging.warning(f"[ExtractPDF] Page pool broke ({e}), scanning the remaining pages serially")
+        _discard_page_pool()
+        yield from iter_page_scans(path, next_page, pages)
+    finally:
+        for future, _ in window:
+            future.cancel()
+        if spilled:
+            # Ranges already running still read the file (and hold it open on Windows)
+            wait([future for future, _ in window])
+            try:
+                os.remove(spilled)
+            except OSError as e:
+                logging.warning(f"[ExtractPDF] Could not remove temp file {spilled}: {e}")
+
 class ExtractPDF:
 
     @staticmethod
-    def extract_text(file_path: str) -> List[tuple[int, str]]:
+    def iter_scans(source: Union[str, bytes], parallel: bool = False) -> Iterator[dict]:
+        """
+        Page scans in order. With `parallel`, a PDF long enough to split is
+        scanned on the shared page pool; callers only ask for it from the main
+        process, never from a worker of another process pool.
+        """
+        pages = page_count(source)
+        workers = page_workers(pages) if parallel else 0
+        if workers <= 1:
+            return iter_page_scans(source, 0, pages)
+        print(f"📑 Scanning {pages} pages on {workers} page-pool workers")
+        return iter_page_scans_parallel(source, pages, workers)
+
+    @staticmethod
+    def scan_pages(source: Union[str, bytes], parallel: bool = False) -> List[dict]:
+        """
+        Single pass over the PDF: one scan per page with its text, image count and
+        raw tables (from pages the ruling-line check flagged). See iter_scans for `parallel`.
+        """
+        return list(ExtractPDF.iter_scans(source, parallel))
+
+    @staticmethod
+    def extract_text(file_path: Union[str, bytes]) -> List[tuple[int, str]]:
         """Extract plain text from each PDF page using PyMuPDF."""
-        page_texts = []
-        try:
-            with fitz.open(file_path) as doc:
-                for page_num, page in enumerate(doc, start=1):
-                    text = page.get_text()
-                    if text.strip():
-                        page_texts.append((page_num, text.strip()))
-        except Exception as e:
-            logging.error(f"[ExtractPDF] Text extraction failed: {e}")
-        return page_texts
+        return [(p["page_num"], p["text"]) for p in iter_page_scans(file_path, tables=False) if p["text"]]
 
     @staticmethod
-    def extract_tables(file_path: str) -> List[tuple[pd.DataFrame, int]]:
-        """Extract tables from PDF using pdfplumber, returns (DataFrame, page_number)."""
+    def tables_from_scan(pages: List[dict]) -> List[tuple[pd.DataFrame, int]]:
+        """Turn raw pdfplumber tables into (DataFrame, page_number)."""
         tables = []
-        try:
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages, start=1):
-                    page_tables = page.extract_tables()
-                    for raw_table in page_tables:
-                        df = pd.DataFrame(raw_table)
-                        if not df.dropna(how="all").empty:
-                            df.columns = df.iloc[0]
-                            df = df[1:].reset_index(drop=True)
-                            tables.append((df, page_num))
-        except Exception as e:
-            logging.warning(f"[ExtractPDF] Table extraction failed: {e}")
+        for page in pages:
+            for raw_table in page["tables"]:
+                df = pd.DataFrame(raw_table)
+                if not df.dropna(how="all").empty:
+                    df.columns = df.iloc[0]
+                    df = df[1:].reset_index(drop=True)
+                    tables.append((df, page["page_num"]))
         return tables
 
     @staticmethod
-    def detect_figures(file_path: str) -> List[str]:
-        """Detect presence of figures/images in PDF."""
-        image_descriptions = []
-        try:
-            with fitz.open(file_path) as doc:
-                for page_num, page in enumerate(doc):
-                    images = page.get_images(full=True)
-                    if images:
-                        image_descriptions.append(f"Page {page_num + 1}: {len(images)} image(s) detected")
-        except Exception as e:
-            logging.warning(f"[ExtractPDF] Image detection failed: {e}")
-        return image_descriptions
+    def extract_tables(file_path: Union[str, bytes]) -> List[tuple[pd.DataFrame, int]]:
+        """Extract tables from PDF using pdfplumber, returns (DataFrame, page_number)."""
+        return ExtractPDF.tables_from_scan(list(iter_page_scans(file_path, text=False)))
 
     @staticmethod
-    def extract_and_chunk(file_path: str) -> List[Document]:
-        print(f"📂 Extracting and chunking: {file_path}")
-        if not os.path.exists(file_path):
-            logging.error(f"[ExtractPDF] File not found: {file_path}")
-            return []
-
-        if os.path.getsize(file_path) == 0:
-            logging.warning(f"[ExtractPDF] Skipping empty file: {file_path}")
-            return []
-
-        source = os.path.basename(file_path)
-        ext = "pdf"  # Force format tag since this extractor is PDF-specific
+    def detect_figures(file_path: Union[str, bytes]) -> List[str]:
+        """Detect presence of figures/images in PDF."""
+        return ExtractPDF.figures_from_scan(list(iter_page_scans(file_path, text=False, tables=False)))
 
-        page_texts = ExtractPDF.extract_text(file_path)
-        tables = ExtractPDF.extract_tables(file_path)
-        figures = ExtractPDF.detect_figures(file_path)
+    @staticmethod
+    def figures_from_scan(pages: List[dict]) -> List[str]:
+        return [f"Page {p['page_num']}: {p['images']} image(s) detected" for p in pages if p["images"]]
 
-        all_nodes = []
-        splitter = SentenceSplitter(
+    @staticmethod
+    def _splitter() -> SentenceSplitter:
+        return SentenceSplitter(
             chunk_size=config.CHUNK_SIZE,
             chunk_overlap=config.CHUNK_OVERLAP
         )
 
-        # Chunk plain text
-        for page_num, page_text in page_texts:
-            document = Document(text=page_text)
-            nodes = splitter.get_nodes_from_documents([document])
-            for i, node in enumerate(nodes):
-                node.metadata = generate_metadata_pdf(
-                    source=source,
-                    index=i,
-                    max_index=len(nodes),
-                    file_format=ext,
-                    page_num=page_num,
-                    headers=None,
-                    row_range="text"
-                )
-                all_nodes.append(node)
+    @staticmethod
+    def _text_nodes(splitter: SentenceSplitter, source: str, page_num: int, page_text: str) -> List:
+        document = Document(text=page_text)
+        nodes = splitter.get_nodes_from_documents([document])
+        for i, node in enumerate(nodes):
+            node.metadata = generate_metadata_pdf(
+                source=source,
+                index=i,
+                max_index=len(nodes),
+                file_format="pdf",
+                page_num=page_num,
+                headers=None,
+                row_range="text"
+            )
+        return nodes
 
-        # Chunk tables
-        for table_id, (df, page_num) in enumerate(tables):
-            if df.empty:
-                continue
-
-            df = df.dropna(how='all', axis=1)
-            df.columns = df.iloc[0].fillna("").astype(str)
-            df = df[1:].reset_index(drop=True)
-
-            lines = []
-            for i, row in df.iterrows():
-                row_dict = {col: val for col, val in zip(df.columns, row.values)}
-                lines.append(f"{i}: {json.dumps(row_dict, ensure_ascii=False)}")
-
-            document = Document(text="\n".join(lines))
-            nodes = splitter.get_nodes_from_documents([document])
-            for i, node in enumerate(nodes):
-                row_range = f"{i * config.CHUNK_SIZE} - {(i + 1) * config.CHUNK_SIZE}"
-                node.metadata = generate_metadata_pdf(
-                    source=source,
-                    index=i,
-                    max_index=len(nodes),
-                    file_format=ext,
-                    page_num=page_num,
-                    headers=df.columns.tolist(),
-                    row_range=row_range,
-                    table_id=f"table_{table_id}"
-                )
-                all_nodes.append(node)
+    @staticmethod
+    def _table_nodes(splitter: SentenceSplitter, source: str, df: pd.DataFrame, page_num: int, table_id: int) -> List:
+        if df.empty:
+            return []
 
-        # Chunk figure/image descriptions
+        df = df.dropna(how='all', axis=1)
+        df.columns = df.iloc[0].fillna("").astype(str)
+        df = df[1:].reset_index(drop=True)
+
+        lines = []
+        for i, row in df.iterrows():
+            row_dict = {col: val for col, val in zip(df.columns, row.values)}
+            lines.append(f"{i}: {json.dumps(row_dict, ensure_ascii=False)}")
+
+        document = Document(text="\n".join(lines))
+        nodes = splitter.get_nodes_from_documents([document])
+        for i, node in enumerate(nodes):
+            row_range = f"{i * config.CHUNK_SIZE} - {(i + 1) * config.CHUNK_SIZE}"
+            node.metadata = generate_metadata_pdf(
+                source=source,
+                index=i,
+                max_index=len(nodes),
+                file_format="pdf",
+                page_num=page_num,
+                headers=df.columns.tolist(),
+                row_range=row_range,
+                table_id=f"table_{table_id}"
+            )
+        return nodes
+
+    @staticmethod
+    def _figure_nodes(source: str, figures: List[str]) -> List[Document]:
+        documents = []
         for i, desc in enumerate(figures):
             document = Document(text=desc)
             match = re.search(r"Page\s+(\d+)", desc)
@@ -143,16 +338,118 @@ class ExtractPDF:
                 source=source,
                 index=i,
                 max_index=len(figures),
-                file_format=ext,
+                file_format="pdf",
                 page_num=page_num,
                 headers=None,
                 row_range="image_detected",
                 table_id=f"figure_{i}"
             )
-            all_nodes.append(document)
+            documents.append(document)
+        return documents
+
+    @staticmethod
+    def _load(file_path: str, data: Union[bytes, BinaryIO] = None) -> Union[str, bytes, None]:
+        """Return what to open (path or bytes), or None if the file is missing or empty."""
+        if data is not None:
+            pdf = data.read() if hasattr(data, "read") else bytes(data)
+        elif not os.path.exists(file_path):
+            logging.error(f"[ExtractPDF] File not found: {file_path}")
+            return None
+        else:
+            pdf = file_path
+
+        if (len(pdf) if data is not None else os.path.getsize(file_path)) == 0:
+            logging.warning(f"[ExtractPDF] Skipping empty file: {file_path}")
+            return None
+        return pdf
+
+    @staticmethod
+    def extract_and_chunk(file_path: str, data: Union[bytes, BinaryIO] = None, parallel: bool = False) -> List[Document]:
+        """
+        Chunk a PDF's text, tables and figure notes. Pass `data` (bytes or a
+        binary file object) to extract from memory; `file_path` then only names the source.
+        `parallel` scans a long PDF's pages on the shared page pool.
+        """
+        print(f"📂 Extracting and chunking: {file_path}")
+        pdf = ExtractPDF._load(file_path, data)
+        if pdf is None:
+            return []
+        source = os.path.basename(file_path)
+
+        try:
+            pages = ExtractPDF.scan_pages(pdf, parallel)
+        except Exception as e:
+            logging.error(f"[ExtractPDF] Could not read PDF {file_path}: {e}")
+            return []
+        page_texts = [(p["page_num"], p["text"]) for p in pages if p["text"]]
+        tables = ExtractPDF.tables_from_scan(pages)
+        figures = ExtractPDF.figures_from_scan(pages)
+
+        scanned = sum(1 for p in pages if p["table_scanned"])
+        print(f"📊 Table detection: {scanned} page(s) scanned with pdfplumber, {len(pages) - scanned} skipped, "
+              f"{len(tables)} table(s) found")
+
+        all_nodes = []
+        splitter = ExtractPDF._splitter()
+
+        # Chunk plain text
+        for page_num, page_text in page_texts:
+            all_nodes.extend(ExtractPDF._text_nodes(splitter, source, page_num, page_text))
+
+        # Chunk tables
+        for table_id, (df, page_num) in enumerate(tables):
+            all_nodes.extend(ExtractPDF._table_nodes(splitter, source, df, page_num, table_id))
+
+        # Chunk figure/image descriptions
+        all_nodes.extend(ExtractPDF._figure_nodes(source, figures))
 
         return all_nodes
 
+    @staticmethod
+    def iter_chunks(file_path: str, data: Union[bytes, BinaryIO] = None, parallel: bool = False) -> Iterator:
+        """
+        Streaming form of extract_and_chunk: yields each page's text and table
+        chunks as soon as the page is scanned, so only one page (or, with
+        `parallel`, a few page ranges) is held in memory. Figure notes (one
+        short line per page with images) come last. A file that can't be read
+        as a PDF is logged and yields nothing, as in extract_and_chunk.
+        """
+        print(f"📂 Streaming chunks from: {file_path}")
+        pdf = ExtractPDF._load(file_path, data)
+        if pdf is None:
+            return
+        source = os.path.basename(file_path)
+        splitter = ExtractPDF._splitter()
+        figures, table_id, scanned, skipped = [], 0, 0, 0
+
+        try:
+            scans = ExtractPDF.iter_scans(pdf, parallel)
+        except Exception as e:
+            logging.error(f"[ExtractPDF] Could not read PDF {file_path}: {e}")
+            return
+        while True:
+            # Only scan errors are handled here; the page loop below is not wrapped
+            try:
+                page = next(scans)
+            except StopIteration:
+                break
+            except Exception as e:
+                logging.error(f"[ExtractPDF] Could not read PDF {file_path}: {e}")
+                return
+            if page["table_scanned"]:
+                scanned += 1
+            else:
+                skipped += 1
+            if page["text"]:
+                yield from ExtractPDF._text_nodes(splitter, source, page["page_num"], page["text"])
+            for df, page_num in ExtractPDF.tables_from_scan([page]):
+                yield from ExtractPDF._table_nodes(splitter, source, df, page_num, table_id)
+                table_id += 1
+            figures.extend(ExtractPDF.figures_from_scan([page]))
+
+        print(f"📊 Table detection: {scanned} page(s) scanned with pdfplumber, {skipped} skipped, {table_id} table(s) found")
+        yield from ExtractPDF._figure_nodes(source, figures)
+
 # --- Optional test run ---
 if __name__ == "__main__":
     nodes = ExtractPDF.extract_and_chunk("./app/documents/sample.pdf")
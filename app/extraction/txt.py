@@ -1,6 +1,6 @@
 import os
 import chardet
-from typing import List
+from typing import Iterator, List
 from llama_index.core import Document
 from llama_index.core.node_parser import SentenceSplitter
 import logging
@@ -11,6 +11,9 @@ from .helper import generate_metadata_txt
 config = Config()
 logging.basicConfig(level=logging.INFO)
 
+# Characters read per block when streaming a large text file
+STREAM_BLOCK_CHARS = 1 << 20
+
 class ExtractTXT:
 
     @staticmethod
@@ -64,6 +67,61 @@ class ExtractTXT:
 
         return all_nodes
 
+    @staticmethod
+    def iter_chunks(file_path: str) -> Iterator:
+        """
+        Streaming form of extract_and_chunk: reads the file in blocks of about
+        STREAM_BLOCK_CHARS, cut at the last paragraph (or line) break, and
+        yields each block's chunks before reading the next. The text after the
+        cut is carried into the next block, so paragraphs are not split
+        across blocks. A chunk's "len" counts the chunks of its block, as a PDF
+        chunk's counts those of its page.
+        """
+        print(f"📂 Streaming chunks from: {file_path}")
+        ext = os.path.splitext(file_path)[-1][1:].lower()
+        source = os.path.basename(file_path)
+
+        if os.path.getsize(file_path) == 0:
+            logging.warning(f"Skipping empty file: {file_path}")
+            return
+
+        splitter = SentenceSplitter(
+            chunk_size=config.CHUNK_SIZE,
+            chunk_overlap=config.CHUNK_OVERLAP
+        )
+        encoding = ExtractTXT.detect_encoding(file_path)
+        index = 0
+        carry = ""
+        with open(file_path, "r", encoding=encoding) as f:
+            while True:
+                block = f.read(STREAM_BLOCK_CHARS)
+                text = carry + block
+                if block:
+                    # Prefer a paragraph break, then a line, sentence or word break
+                    cut = -1
+                    for sep in ("\n\n", "\n", ". ", " "):
+                        cut = text.rfind(sep, len(carry))
+                        if cut > 0:
+                            break
+                    if cut <= 0:
+                        cut = len(text)
+                    text, carry = text[:cut], text[cut:]
+
+                if text.strip():
+                    nodes = splitter.get_nodes_from_documents([Document(text=text)])
+                    for node in nodes:
+                        node.metadata = generate_metadata_txt(
+                            source=source,
+                            index=index,
+                            max_index=len(nodes),
+                            file_format=ext,
+                            page_num=1
+                        )
+                        index += 1
+                        yield node
+                if not block:
+                    break
+
 if __name__ == "__main__":
     nodes = ExtractTXT.extract_and_chunk("./app/documents/Data quality.txt")
     for node in nodes:
@@ -0,0 +1,243 @@
+import os
+import time
+import hashlib
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional
+
+import boto3
+from dotenv import load_dotenv
+
+from app.config import Config
+from app.extraction.options import ExtractStrategy
+from app.ingestion.extract import submit_extraction
+
+config = Config()
+
+
+def make_s3_client():
+    load_dotenv()
+    return boto3.client(
+        "s3",
+        endpoint_url=f"http://{os.getenv('MINIO_ENDPOINT')}",
+        aws_access_key_id=os.getenv("ACCESS_KEY"),
+        aws_secret_access_key=os.getenv("SECRET_KEY"),
+    )
+
+
+def list_objects(s3, bucket: str, prefix: str = "") -> Dict[str, str]:
+    """Return {object key: ETag} for every object under the prefix."""
+    objects = {}
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []):
+            if not item["Key"].endswith("/"):
+                objects[item["Key"]] = item["ETag"].strip('"')
+    return objects
+
+
+def bulk_ingest(
+    bucket: str,
+    prefix: str = "",
+    s3=None,
+    extraction_pool: Optional[ProcessPoolExecutor] = None,
+    download_workers: int = config.BULK_DOWNLOAD_WORKERS,
+    batch_chunks: int = config.BULK_INDEX_BATCH_CHUNKS,
+    max_inflight: int = config.BULK_MAX_INFLIGHT_FILES,
+    skip_unchanged: bool = True,
+    progress: Optional[Callable] = None,
+) -> Dict:
+    """
+    Ingest every supported object under bucket/prefix.
+
+    Downloads run on a thread pool and extraction on a process pool, so
+    several files are fetched and parsed at once. Extracted chunks from many
+    files are embedded and upserted together in batches of about
+    `batch_chunks`. At most `max_inflight` files are between download and
+    indexing at any time; new downloads start only as earlier files are
+    indexed or fail, so a slow embedder throttles the downloads instead of
+    filling the disk and memory. Objects whose ETag is already indexed are
+    skipped, so an interrupted backfill can simply be run again. Files with
+    chunks that failed to embed are reported as failures and are not marked
+    as indexed, so the next run retries them.
+    """
+    # Imported here, not at module level: spawned extraction and page-pool workers
+    # re-import this module as __mp_main__ when it runs as the CLI, and must not
+    # connect to the vector store or open its caches
+    from app.ingestion.ingestion_pipeline import index_documents, IncompleteIndexError
+    from app.answer_cache import document_versions
+    from app.vectorstore import ensure_collection
+
+    progress = progress or (lambda stage=None, **counters: None)
+    max_inflight = max(1, max_inflight)
+    s3 = s3 or make_s3_client()
+    own_pool = extraction_pool is None
+    if own_pool:
+        extraction_pool = ProcessPoolExecutor(
+            max_workers=config.EXTRACTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    started = time.perf_counter()
+    ensure_collection()
+    progress("listing")
+    objects = list_objects(s3, bucket, prefix)
+
+    unsupported = [key for key in objects if ExtractStrategy.get_extractor(key) is None]
+    todo = {key: etag for key, etag in objects.items() if key not in unsupported}
+    unchanged = []
+    if skip_unchanged and todo:
+        current = document_versions.get(list(todo))
+        unchanged = [key for key, etag in todo.items() if current[key] == etag]
+        for key in unchanged:
+            del todo[key]
+    print(f"📦 {len(objects)} object(s) under '{bucket}/{prefix}': {len(todo)} to ingest, "
+          f"{len(unchanged)} unchanged, {len(unsupported)} unsupported")
+    progress("ingesting", files_listed=len(objects), files_to_ingest=len(todo))
+
+    workdir = tempfile.mkdtemp(prefix="bulk_ingest_")
+    failures: List[Dict] = []
+    counters = {"files_downloaded": 0, "files_extracted": 0, "files_indexed": 0, "chunks_indexed": 0}
+    batch: List = []  # (nodes, source, version) waiting to be embedded together
+    batch_size = 0
+    inflight = 0  # files submitted but not yet indexed or failed
+    keys = iter(todo)
+
+    def local_dir(key: str) -> str:
+        # Named by a hash of the key, so keys like "/x" or "../x" can't leave workdir
+        return os.path.join(workdir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def download(key: str) -> str:
+        file_name = os.path.basename(key)
+        if file_name in ("", ".", ".."):
+            raise ValueError(f"invalid object key '{key}'")
+        os.makedirs(local_dir(key), exist_ok=True)
+        local_path = os.path.join(local_dir(key), file_name)
+        s3.download_file(bucket, key, local_path)
+        return local_path
+
+    def flush():
+        nonlocal batch, batch_size, inflight
+        if not batch:
+            return
+        try:
+            vectors = index_documents(batch)
+            counters["files_indexed"] += len(batch)
+            counters["chunks_indexed"] += len(vectors)
+        except IncompleteIndexError as e:
+            counters["files_indexed"] += len(batch) - len(e.sources)
+            counters["chunks_indexed"] += len(e.vectors)
+            failures.extend(
+                {"file": source, "stage": "embedding", "error": "some chunks could not be embedded"}
+                for source in e.sources
+            )
+        except Exception as e:
+            failures.extend({"file": source, "stage": "indexing", "error": str(e)} for _, source, _ in batch)
+        inflight -= len(batch)
+        batch, batch_size = [], 0
+        progress(**counters, files_failed=len(failures))
+
+    try:
+        with ThreadPoolExecutor(max_workers=download_workers) as downloads:
+            pending = {}
+
+            def submit_more():
+                nonlocal inflight
+                while inflight < max_inflight:
+                    key = next(keys, None)
+                    if key is None:
+                        return
+                    pending[downloads.submit(download, key)] = ("download", key)
+                    inflight += 1
+
+            submit_more()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, key = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failures.append({"file": key, "stage": stage, "error": str(e)})
+                        inflight -= 1
+                        continue
+                    finally:
+                        # The local copy is only needed until extraction ends, however it ends
+                        if stage == "extract" or future.exception() is not None:
+                            shutil.rmtree(local_dir(key), ignore_errors=True)
+
+                    if stage == "download":
+                        counters["files_downloaded"] += 1
+                        pending[submit_extraction(extraction_pool, result)] = ("extract", key)
+                        continue
+
+                    counters["files_extracted"] += 1
+                    if not result:
+                        failures.append({"file": key, "stage": "extract", "error": "no chunks extracted"})
+                        inflight -= 1
+                        continue
+                    batch.append((result, key, todo[key]))
+                    batch_size += len(result)
+                    if batch_size >= batch_chunks:
+                        flush()
+                # Every in-flight file is waiting in the batch: index it to free the window
+                if not pending and batch:
+                    flush()
+                submit_more()
+            flush()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if own_pool:
+            extraction_pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "bucket": bucket,
+        "prefix": prefix,
+        "files_listed": len(objects),
+        "files_ingested": counters["files_indexed"],
+        "files_unchanged": len(unchanged),
+        "files_unsupported": len(unsupported),
+        "files_failed": len(failures),
+        "chunks": counters["chunks_indexed"],
+        "elapsed_sec": round(elapsed, 2),
+        "files_per_sec": round(counters["files_indexed"] / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_sec": round(counters["chunks_indexed"] / elapsed, 1) if elapsed else 0.0,
+        "failures": failures,
+    }
+    print_report(report)
+    return report
+
+
+def print_report(report: Dict):
+    print(f"\n📊 Bulk ingest of '{report['bucket']}/{report['prefix']}' finished in {report['elapsed_sec']} s")
+    print(f"   ✅ {report['files_ingested']} file(s), {report['chunks']} chunk(s) "
+          f"— {report['files_per_sec']} files/sec, {report['chunks_per_sec']} chunks/sec")
+    print(f"   ⏭️ {report['files_unchanged']} unchanged, {report['files_unsupported']} unsupported")
+    print(f"   ❌ {report['files_failed']} failed")
+    for failure in report["failures"]:
+        print(f"      - {failure['file']} ({failure['stage']}): {failure['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest every supported object under a MinIO bucket/prefix.")
+    parser.add_argument("--bucket", default=None, help="defaults to BUCKET_NAME from .env")
+    parser.add_argument("--prefix", default="")
+    parser.add_argument("--download-workers", type=int, default=config.BULK_DOWNLOAD_WORKERS)
+    parser.add_argument("--batch-chunks", type=int, default=config.BULK_INDEX_BATCH_CHUNKS)
+    parser.add_argument("--max-inflight", type=int, default=config.BULK_MAX_INFLIGHT_FILES)
+    parser.add_argument("--force", action="store_true", help="re-ingest objects whose ETag is already indexed")
+    args = parser.parse_args()
+
+    load_dotenv()
+    report = bulk_ingest(
+        bucket=args.bucket or os.getenv("BUCKET_NAME"),
+        prefix=args.prefix,
+        download_workers=args.download_workers,
+        batch_chunks=args.batch_chunks,
+        max_inflight=args.max_inflight,
+        skip_unchanged=not args.force,
+    )
+    raise SystemExit(1 if report["files_failed"] else 0)
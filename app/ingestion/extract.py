@@ -0,0 +1,134 @@
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+from app.config import Config
+from app.extraction.options import ExtractStrategy
+from app.extraction.pdf import ExtractPDF, shutdown_page_pool, splits_pages
+
+config = Config()
+
+def uses_page_pool(file_path: str, data: bytes = None) -> bool:
+    """
+    PDFs long enough to be split across the shared page pool. Anything shorter
+    is better off in a worker of its own than on a thread of this process.
+    """
+    if ExtractStrategy.get_extractor(file_path) is not ExtractPDF:
+        return False
+    return splits_pages(data if data is not None else file_path)
+
+def extract_nodes(file_path: str, data: bytes = None, parallel_pages: bool = False):
+    """
+    CPU-bound extraction and chunking only. Lives in its own module, away from the
+    embedding and vector-store imports, so process-pool workers can load it cheaply.
+    `data` holds the file in memory for extractors that accept it (PDF); `file_path`
+    then only names the source. `parallel_pages` lets a PDF use the page pool, so
+    it is only set in the main process (see submit_extraction).
+    """
+    extractor_cls = ExtractStrategy.get_extractor(file_path)
+    if not extractor_cls:
+        raise ValueError(f"No extractor found for file type: {file_path}")
+
+    print(f"🔍 Using extractor: {extractor_cls.__name__}")
+    options = {"parallel": True} if parallel_pages and extractor_cls is ExtractPDF else {}
+    if data is not None:
+        nodes = extractor_cls.extract_and_chunk(file_path, data=data, **options)
+    else:
+        nodes = extractor_cls.extract_and_chunk(file_path, **options)
+    print(f"📄 Extracted {len(nodes)} chunks")
+
+    for i, n in enumerate(nodes[:3]):
+        print(f"📎 Chunk {i+1}: {n.text[:100]}...")
+    return nodes
+
+def iter_nodes(file_path: str, parallel_pages: bool = False):
+    """
+    Yield chunks as the extractor produces them. Extractors with iter_chunks
+    stream (PDF page by page, text in blocks, CSV in row slices); the others
+    are chunked whole and then yielded. `parallel_pages` as in extract_nodes.
+    """
+    extractor_cls = ExtractStrategy.get_extractor(file_path)
+    if not extractor_cls:
+        raise ValueError(f"No extractor found for file type: {file_path}")
+
+    print(f"🔍 Streaming with extractor: {extractor_cls.__name__}")
+    if parallel_pages and extractor_cls is ExtractPDF:
+        yield from extractor_cls.iter_chunks(file_path, parallel=True)
+    elif hasattr(extractor_cls, "iter_chunks"):
+        yield from extractor_cls.iter_chunks(file_path)
+    else:
+        yield from extractor_cls.extract_and_chunk(file_path)
+
+_pdf_threads = None
+_pdf_threads_lock = threading.Lock()
+
+def _get_pdf_threads() -> ThreadPoolExecutor:
+    global _pdf_threads
+    with _pdf_threads_lock:
+        if _pdf_threads is None:
+            _pdf_threads = ThreadPoolExecutor(max_workers=config.EXTRACTION_WORKERS, thread_name_prefix="pdf-extract")
+        return _pdf_threads
+
+def submit_extraction(extraction_pool, file_path: str, data: bytes = None) -> Future:
+    """
+    Run extract_nodes for one file. PDFs long enough to split are extracted on
+    threads of this process, whose page scans fan out over the shared page pool
+    (a worker of `extraction_pool` cannot start processes of its own); every
+    other file, short PDFs included, is sent to `extraction_pool`.
+    """
+    if uses_page_pool(file_path, data):
+        return _get_pdf_threads().submit(extract_nodes, file_path, data, True)
+    return extraction_pool.submit(extract_nodes, file_path, data)
+
+def shutdown_extraction():
+    """Stop the PDF extraction threads and the page pool (at app shutdown)."""
+    global _pdf_threads
+    with _pdf_threads_lock:
+        if _pdf_threads is not None:
+            _pdf_threads.shutdown(wait=False, cancel_futures=True)
+            _pdf_threads = None
+    shutdown_page_pool()
+
+def _produce_nodes(file_path: str, out, batch_size: int):
+    """Subprocess side of iter_nodes_in_subprocess: put batches of chunks on `out`."""
+    try:
+        batch = []
+        for node in iter_nodes(file_path):
+            batch.append(node)
+            if len(batch) >= batch_size:
+                out.put(("chunks", batch))
+                batch = []
+        if batch:
+            out.put(("chunks", batch))
+        out.put(("done", None))
+    except Exception as e:
+        out.put(("error", f"{type(e).__name__}: {e}"))
+
+def iter_nodes_in_subprocess(file_path: str, batch_size: int = 64, max_batches: int = 4):
+    """
+    Run iter_nodes in a separate process and yield its chunks here. The queue
+    between the two holds at most `max_batches` batches, so a slow consumer
+    pauses extraction instead of letting chunks pile up in memory.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue(maxsize=max_batches)
+    worker = ctx.Process(target=_produce_nodes, args=(file_path, out, batch_size), daemon=True)
+    worker.start()
+    try:
+        while True:
+            try:
+                kind, payload = out.get(timeout=5)
+            except queue.Empty:
+                if not worker.is_alive():
+                    raise RuntimeError(f"Extraction process for '{file_path}' exited unexpectedly")
+                continue
+            if kind == "chunks":
+                yield from payload
+            elif kind == "error":
+                raise RuntimeError(payload)
+            else:
+                break
+    finally:
+        if worker.is_alive():
+            worker.terminate()
+        worker.join()
@@ -1,25 +1,218 @@
-from app.extraction.options import ExtractStrategy
+import os
+import queue
+import hashlib
+import threading
+from itertools import islice
+from collections import Counter
+from typing import Dict, Iterable, List
+from app.config import Config
+from app.ingestion.extract import iter_nodes
 from app.embedding import embed_nodes
-from app.vectorstore import upsert_vectors
+from app.vectorstore import upsert_vectors, delete_stale_versions
 
-def process_documents(file_path: str):
-    extractor_cls = ExtractStrategy.get_extractor(file_path)
-    if not extractor_cls:
-        raise ValueError(f"No extractor found for file type: {file_path}")
+config = Config()
 
-    print(f"🔍 Using extractor: {extractor_cls.__name__}")
-    nodes = extractor_cls.extract_and_chunk(file_path)
-    print(f"📄 Extracted {len(nodes)} chunks")
+def file_version(file_path: str) -> str:
+    """Content hash used as the document version when no ETag is known."""
+    digest = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def tag_nodes(nodes, source: str, version: str, start: int = 0):
+    # Point IDs are derived from (source, version, chunk_index), so re-ingests replace in place
+    for i, n in enumerate(nodes, start):
+        n.metadata["source"] = source
+        n.metadata["doc_version"] = version
+        n.metadata["chunk_index"] = i
+
+class IncompleteIndexError(RuntimeError):
+    """
+    Some chunks could not be embedded. The documents in `sources` keep their
+    previous version as the registered one, so a re-run ingests them again;
+    `vectors` holds everything that was upserted.
+    """
+
+    def __init__(self, sources: List[str], failed: int, vectors: List):
+        super().__init__(f"{failed} chunk(s) of {', '.join(sources)} could not be embedded")
+        self.sources = sources
+        self.failed = failed
+        self.vectors = vectors
+
+def index_documents(documents, progress=None):
+    """
+    Embed and upsert the nodes of several documents in shared batches, then drop
+    older versions of each. `documents` is a list of (nodes, source, version).
+    `progress(stage, **counters)` is called as each stage starts and finishes.
+
+    A document with chunks that failed to embed is left half-indexed: its older
+    versions are kept and its new version is not registered, and
+    IncompleteIndexError is raised once the complete documents are done.
+    """
+    progress = progress or (lambda stage=None, **counters: None)
+    nodes = []
+    for doc_nodes, source, version in documents:
+        tag_nodes(doc_nodes, source, version)
+        nodes.extend(doc_nodes)
     if not nodes:
         return []
 
-    for i, n in enumerate(nodes[:3]):
-        print(f"📎 Chunk {i+1}: {n.text[:100]}...")
-
-    vectors = embed_nodes(nodes)
+    progress("embedding")
+    vectors, failed = embed_nodes(nodes)
+    progress(chunks_embedded=len(vectors), chunks_failed=failed)
     print(f"🧠 Embedded {len(vectors)} vectors")
 
+    progress("upserting")
     upsert_vectors(vectors)
+    incomplete = []
+    if failed:
+        expected = Counter(n.metadata["source"] for n in nodes if n.text and n.text.strip())
+        embedded = Counter(v["metadata"]["source"] for v in vectors)
+        incomplete = [source for source in expected if embedded[source] < expected[source]]
+    for _, source, version in documents:
+        if source not in incomplete:
+            delete_stale_versions(source, version)
+    progress(points_upserted=len(vectors))
     print(f"✅ Upserted {len(vectors)} vectors to Qdrant")
 
+    if incomplete:
+        raise IncompleteIndexError(incomplete, failed, vectors)
     return vectors
+
+def index_nodes(nodes, source: str, version: str, progress=None):
+    """Embed and upsert one document's extracted nodes, then drop its older versions."""
+    if not nodes:
+        return []
+    return index_documents([(nodes, source, version)], progress)
+
+# --- ✅ Streaming pipeline: extract → embed → upsert with bounded queues ---
+_DONE = object()
+
+def stream_index(chunks: Iterable, source: str, version: str, progress=None,
+                 batch_size: int = config.STREAM_BATCH_CHUNKS, queue_batches: int = config.STREAM_QUEUE_BATCHES) -> Dict:
+    """
+    Index a document whose chunks arrive from an iterator, without ever holding
+    the whole document in memory.
+
+    Chunks are grouped into batches of `batch_size` and flow through two queues
+    of at most `queue_batches` batches each: an extraction thread fills the
+    first, an embedding thread moves batches to the second, and this thread
+    upserts them. A full queue blocks the stage before it, so a slow embedder
+    or vector store slows extraction down instead of growing memory.
+
+    Every upserted batch stays put if a later stage fails: point IDs are
+    deterministic and embeddings are cached, so re-running the ingest only
+    redoes the missing work. Older versions of the document are removed, and
+    the new one registered, only after every chunk of it is indexed; a chunk
+    that fails to embed fails the ingest.
+    """
+    progress = progress or (lambda stage=None, **counters: None)
+    to_embed = queue.Queue(maxsize=queue_batches)
+    to_upsert = queue.Queue(maxsize=queue_batches)
+    stop = threading.Event()
+    errors = []
+    counters = {"chunks_extracted": 0, "chunks_embedded": 0, "chunks_failed": 0, "points_upserted": 0}
+
+    def put(q, item) -> bool:
+        # Blocking put that gives up once another stage has failed
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fail(stage: str, e: Exception):
+        errors.append((stage, e))
+        stop.set()
+
+    def extract_stage():
+        iterator = iter(chunks)
+        try:
+            while True:
+                batch = list(islice(iterator, batch_size))
+                if not batch:
+                    break
+                tag_nodes(batch, source, version, start=counters["chunks_extracted"])
+                counters["chunks_extracted"] += len(batch)
+                progress(chunks_extracted=counters["chunks_extracted"])
+                if not put(to_embed, batch):
+                    return
+            put(to_embed, _DONE)
+        except Exception as e:
+            fail("extracting", e)
+        finally:
+            # Release the extractor (open files, worker process) however we stopped
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def embed_stage():
+        try:
+            while True:
+                batch = get(to_embed)
+                if batch is _DONE:
+                    break
+                vectors, failed = embed_nodes(batch)
+                counters["chunks_embedded"] += len(vectors)
+                counters["chunks_failed"] += failed
+                progress(chunks_embedded=counters["chunks_embedded"], chunks_failed=counters["chunks_failed"])
+                if vectors and not put(to_upsert, vectors):
+                    return
+            put(to_upsert, _DONE)
+        except Exception as e:
+            fail("embedding", e)
+
+    progress("streaming")
+    threads = [
+        threading.Thread(target=extract_stage, name=f"extract-{source}", daemon=True),
+        threading.Thread(target=embed_stage, name=f"embed-{source}", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            vectors = get(to_upsert)
+            if vectors is _DONE:
+                break
+            upsert_vectors(vectors)
+            counters["points_upserted"] += len(vectors)
+            progress(points_upserted=counters["points_upserted"])
+    except Exception as e:
+        fail("upserting", e)
+    finally:
+        for t in threads:
+            t.join()
+
+    if errors:
+        stage, e = errors[0]
+        raise RuntimeError(
+            f"Streaming ingest of '{source}' failed while {stage} "
+            f"({counters['points_upserted']} points already upserted): {e}"
+        ) from e
+    if counters["chunks_failed"]:
+        raise RuntimeError(
+            f"Streaming ingest of '{source}' is incomplete: {counters['chunks_failed']} chunk(s) "
+            f"could not be embedded ({counters['points_upserted']} points upserted); older versions were kept"
+        )
+
+    if counters["points_upserted"]:
+        delete_stale_versions(source, version)
+    print(f"✅ Streamed {counters['chunks_extracted']} chunks → {counters['points_upserted']} points for '{source}'")
+    return counters
+
+def process_documents(file_path: str, version: str = None, source: str = None):
+    """Ingest a local file through the streaming pipeline."""
+    source = source or os.path.basename(file_path)
+    version = version or file_version(file_path)
+    return stream_index(iter_nodes(file_path), source, version)
@@ -0,0 +1,138 @@
+import time
+import uuid
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from typing import Callable, Dict, List, Optional
+
+from app.config import Config
+
+config = Config()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    params: Dict
+    status: str = "queued"  # queued | running | succeeded | failed
+    stage: str = "queued"  # e.g. downloading, extracting, embedding, upserting, done
+    progress: Dict = field(default_factory=dict)  # e.g. {"chunks_extracted": 120, "chunks_embedded": 64}
+    message: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Worker threads update progress while API handlers serialize it
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def update(self, stage: str = None, **progress):
+        """Called by the running job to report its stage and counters."""
+        with self._lock:
+            if stage:
+                self.stage = stage
+            self.progress.update(progress)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            data = {f.name: getattr(self, f.name) for f in fields(self) if not f.name.startswith("_")}
+            data["params"] = dict(self.params)
+            data["progress"] = dict(self.progress)
+        end = data["finished_at"] or time.time()
+        data["elapsed_sec"] = round(end - data["started_at"], 2) if data["started_at"] else None
+        return data
+
+
+class JobManager:
+    """
+    Runs background jobs on a dedicated thread pool, so ingestion never holds
+    an HTTP request open and never competes with query serving for the
+    event loop's default executor.
+
+    Jobs live in memory: status survives for the life of the process, and
+    only the most recent `max_retained` finished jobs are kept.
+    """
+
+    def __init__(self, workers: int, max_retained: int):
+        self.max_retained = max_retained
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._targets: Dict[str, Callable[[Job], str]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, params: Dict, target: Callable[[Job], str]) -> Job:
+        """
+        Queue `target(job)`. It runs in a worker thread, reports progress with
+        job.update() and returns a summary message; raising marks the job failed.
+        """
+        job = Job(id=uuid.uuid4().hex, kind=kind, params=params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._targets[job.id] = target
+            self._trim()
+        self._pool.submit(self._run, job)
+        return job
+
+    def retry(self, job_id: str) -> Optional[Job]:
+        """Re-queue a failed job with the same parameters. Returns None if it is not retryable."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "failed":
+                return None
+            with job._lock:
+                job.status, job.stage, job.progress = "queued", "queued", {}
+                job.error = job.message = None
+                job.started_at = job.finished_at = None
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self, limit: int = 50) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())[-limit:][::-1]
+
+    def _run(self, job: Job):
+        # Each transition happens under the job's lock, so to_dict never sees half of one
+        with job._lock:
+            job.status = "running"
+            job.started_at = time.time()
+            job.attempts += 1
+        try:
+            message = self._targets[job.id](job)
+            with job._lock:
+                job.message = message
+                job.status = "succeeded"
+                job.stage = "done"
+                job.finished_at = time.time()
+        except Exception as e:
+            with job._lock:
+                job.status = "failed"
+                job.error = str(e)
+                job.finished_at = time.time()
+                stage = job.stage
+            logger.error(f"❌ Job {job.id} ({job.kind}) failed at '{stage}': {e}\n{traceback.format_exc()}")
+
+    def _trim(self):
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("succeeded", "failed")]
+        for jid in finished[:max(0, len(self._jobs) - self.max_retained)]:
+            del self._jobs[jid]
+            self._targets.pop(jid, None)
+
+    def stats(self) -> Dict:
+        counts: Dict[str, int] = {}
+        for job in list(self._jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager(workers=config.INGEST_CONCURRENCY, max_retained=config.JOBS_MAX_RETAINED)
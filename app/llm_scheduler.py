@@ -0,0 +1,152 @@
+import time
+import heapq
+import asyncio
+import itertools
+from typing import Dict, List, Optional
+
+from app.config import Config
+
+config = Config()
+
+# Lower value = served first
+INTERACTIVE = 0
+BATCH = 1
+
+
+class LLMOverloaded(Exception):
+    """Raised when a generation cannot be admitted: the queue is full or the wait timed out."""
+
+    def __init__(self, reason: str, queue_depth: int, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class LLMQueueFull(LLMOverloaded):
+    pass
+
+
+class LLMQueueTimeout(LLMOverloaded):
+    pass
+
+
+class LLMSlot:
+    """A running generation's hold on the LLM. release() is idempotent."""
+
+    def __init__(self, scheduler: "LLMScheduler"):
+        self._scheduler = scheduler
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release(time.monotonic() - self._started)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the single local Ollama.
+
+    At most `max_concurrency` generations run at once (set it to Ollama's
+    num_parallel; more would only queue inside Ollama where we cannot see or
+    prioritize them). Up to `max_queue` more wait here in priority order, so
+    interactive queries overtake batch and eval traffic. Anything beyond that
+    is rejected immediately, and waiters give up after `queue_timeout`
+    seconds, so callers get a fast, honest "busy" instead of a long timeout.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._avg_service = 5.0  # seconds, EWMA of generation time
+        self._waiters: List = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+    def retry_after(self) -> int:
+        """Rough seconds until a new request would start, from the queue depth and average generation time."""
+        return max(1, round((self.queue_depth + 1) * self._avg_service / self.max_concurrency))
+
+    async def acquire(self, priority: int = INTERACTIVE) -> LLMSlot:
+        if self.running < self.max_concurrency and not self.queue_depth:
+            return self._admit()
+
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise LLMQueueFull("LLM queue is full", self.queue_depth, self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            # The slot is handed over by _release(), which resolves the future
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just as we gave up: pass it on
+                self._release(None)
+            future.cancel()
+            self._prune()
+            self.timed_out += 1
+            raise LLMQueueTimeout("Timed out waiting for the LLM", self.queue_depth, self.retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(None)
+            future.cancel()
+            raise
+        return LLMSlot(self)
+
+    def _prune(self):
+        self._waiters = [w for w in self._waiters if not w[2].done()]
+        heapq.heapify(self._waiters)
+
+    def _admit(self) -> LLMSlot:
+        self.running += 1
+        self.admitted += 1
+        return LLMSlot(self)
+
+    def _release(self, duration: Optional[float]):
+        if duration is not None:
+            self._avg_service = 0.8 * self._avg_service + 0.2 * duration
+        # Hand the slot straight to the highest-priority live waiter
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.admitted += 1
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    def stats(self) -> Dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "queued": self.queue_depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_generation_sec": round(self._avg_service, 2),
+        }
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=config.LLM_MAX_CONCURRENCY,
+    max_queue=config.LLM_MAX_QUEUE,
+    queue_timeout=config.LLM_QUEUE_TIMEOUT
+)
@@ -0,0 +1,422 @@
+import os
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import numpy as np
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Rows scored per matrix slice; bounds the float32 copy made from float16 storage
+SCORE_BLOCK_ROWS = 65536
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock on `path` held across processes until the block exits."""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10 s; keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@dataclass
+class LocalHit:
+    """Search result with the same attributes the app reads from Qdrant's ScoredPoint."""
+    id: str
+    score: float
+    payload: Dict = field(default_factory=dict)
+
+
+class LocalVectorIndex:
+    """
+    In-process vector index used instead of a Qdrant server.
+
+    Vectors are L2-normalized and kept in a memory-mapped float32/float16 matrix
+    (`vectors.bin`), so cosine similarity is a matrix-vector product, computed
+    in float32 blocks. IDs and payloads live in an append-only JSON-lines log
+    (`payloads.jsonl`) that records only the rows each write touched and is
+    compacted once most of it is superseded. Deleted rows are recycled by
+    later upserts.
+
+    Search is exact top-k by default. If hnswlib is installed and the index
+    holds at least `hnsw_threshold` vectors, unscoped searches use an HNSW
+    graph built on first use and kept up to date on writes.
+
+    Several processes (the API and the bulk-ingest CLI) can share one index
+    directory: writes hold an exclusive lock on `index.lock` and first replay
+    whatever other processes appended to the log, and reads catch up the
+    same way whenever the log's size, mtime or inode has changed.
+    """
+
+    def __init__(self, path: str, dim: int, dtype: str = "float32", hnsw_threshold: int = 0):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.hnsw_threshold = hnsw_threshold
+        self._lock = threading.RLock()
+
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.bin")
+        self._log_path = os.path.join(path, "payloads.jsonl")
+        self._lock_path = os.path.join(path, "index.lock")
+        self._lock_depth = 0
+        self.source_codes: Dict[str, int] = {}
+        with self._writing(refresh=False):
+            self._load()
+
+    # --- Storage ---
+    @contextmanager
+    def _writing(self, refresh: bool = True):
+        """
+        Hold the thread lock and the cross-process file lock, after catching up
+        with what other processes wrote. Re-entrant within one thread.
+        """
+        with self._lock:
+            if self._lock_depth == 0:
+                lock = _file_lock(self._lock_path)
+                lock.__enter__()
+            self._lock_depth += 1
+            try:
+                if refresh and self._lock_depth == 1:
+                    self._refresh()
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    lock.__exit__(None, None, None)
+
+    def _log_state(self):
+        try:
+            st = os.stat(self._log_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _sync(self):
+        """Catch up with other processes' writes if the log changed since we last read it."""
+        if self._log_state() != self._seen:
+            with self._writing():
+                pass
+
+    def _load(self):
+        self.ids: List[Optional[str]] = []
+        self.payloads: List[Optional[Dict]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.free_rows: List[int] = []
+        self._hnsw = None
+        self._log_lines = 0
+        self._log_offset = 0
+
+        capacity = 1024
+        if os.path.exists(self._vectors_path):
+            capacity = max(capacity, os.path.getsize(self._vectors_path) // (self.dim * self.dtype.itemsize))
+        self._open_matrix(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.sources = np.full(capacity, -1, dtype=np.int32)
+
+        if os.path.exists(self._log_path):
+            with open(self._log_path, "rb") as f:
+                self._replay(f)
+            self._drop_torn_tail()
+        if not os.path.exists(self._log_path) or self._log_lines > len(self.ids):
+            self._compact()
+        self._seen = self._log_state()
+        print(f"[LocalIndex] Loaded {len(self.id_to_row)} vectors from '{self.path}'")
+
+    def _refresh(self):
+        """Apply log entries appended by other processes, or reload after they compacted it."""
+        state = self._log_state()
+        if state is None or state == self._seen:
+            return
+        inode, size, _ = state
+        if self._seen is None or inode != self._seen[0] or size < self._log_offset:
+            self.matrix.flush()
+            self._load()
+            return
+        with open(self._log_path, "rb") as f:
+            f.seek(self._log_offset)
+            self._replay(f)
+        self._drop_torn_tail()
+        self._seen = self._log_state()
+
+    def _replay(self, f):
+        """Read log entries from f's position and apply them; stops before a torn last line."""
+        touched: Dict[int, tuple] = {}
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            self._log_offset += len(line)
+            if "row" not in entry:
+                if entry["dim"] != self.dim:
+                    raise ValueError(f"Local index at '{self.path}' has dim {entry['dim']}, expected {self.dim}")
+                continue
+            touched[entry["row"]] = (entry["id"], entry.get("payload"))
+            self._log_lines += 1
+        if not touched:
+            return
+
+        top = max(touched) + 1
+        if top > len(self.ids):
+            self.ids.extend([None] * (top - len(self.ids)))
+            self.payloads.extend([None] * (top - len(self.payloads)))
+        self._grow(top)
+        for row in touched:
+            old = self.ids[row]
+            if old is not None and self.id_to_row.get(old) == row:
+                del self.id_to_row[old]
+        for row, (point_id, payload) in touched.items():
+            self.ids[row], self.payloads[row] = point_id, payload
+            if point_id is None:
+                self.alive[row] = False
+                self.sources[row] = -1
+                if self._hnsw is not None:
+                    try:
+                        self._hnsw.mark_deleted(row)
+                    except RuntimeError:
+                        pass  # never added to the graph
+                continue
+            self.id_to_row[point_id] = row
+            self.alive[row] = True
+            self.sources[row] = self._source_code(payload.get("source"))
+            if self._hnsw is not None:
+                self._hnsw.add_items(np.asarray(self.matrix[[row]], dtype=np.float32), [row])
+        self.free_rows = [row for row, point_id in enumerate(self.ids) if point_id is None]
+
+    def _drop_torn_tail(self):
+        """Cut a partial line left by a writer that died mid-append, so new entries start on a fresh line."""
+        if os.path.getsize(self._log_path) > self._log_offset:
+            logging.warning(f"[LocalIndex] Dropping a torn entry at the end of '{self._log_path}'")
+            with open(self._log_path, "r+b") as f:
+                f.truncate(self._log_offset)
+
+    def _open_matrix(self, capacity: int):
+        mode = "r+" if os.path.exists(self._vectors_path) else "w+"
+        size = capacity * self.dim * self.dtype.itemsize
+        if mode == "r+" and os.path.getsize(self._vectors_path) < size:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(size)
+        self.matrix = np.memmap(self._vectors_path, dtype=self.dtype, mode=mode, shape=(capacity, self.dim))
+
+    def _grow(self, needed: int):
+        capacity = self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        self.matrix.flush()
+        del self.matrix
+        self._open_matrix(new_capacity)
+        self.alive = np.concatenate([self.alive, np.zeros(new_capacity - capacity, dtype=bool)])
+        self.sources = np.concatenate([self.sources, np.full(new_capacity - capacity, -1, dtype=np.int32)])
+        if self._hnsw is not None:
+            self._hnsw.resize_index(new_capacity)
+
+    @staticmethod
+    def _log_entry(row: int, point_id: Optional[str], payload: Optional[Dict]) -> str:
+        return json.dumps({"row": row, "id": point_id, "payload": payload}, separators=(",", ":")) + "\n"
+
+    def _save(self, rows: List[int]):
+        """Append the current state of `rows` to the log; vectors are flushed first."""
+        self.matrix.flush()
+        with open(self._log_path, "ab") as f:
+            f.write("".join(self._log_entry(row, self.ids[row], self.payloads[row]) for row in rows).encode("utf-8"))
+            self._log_offset = f.tell()
+        self._log_lines += len(rows)
+        # Rewrite once superseded entries outnumber live rows, so the log stays O(rows)
+        if self._log_lines > 2 * max(len(self.id_to_row), 1024):
+            self._compact()
+        self._seen = self._log_state()
+
+    def _compact(self):
+        tmp = self._log_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"dim": self.dim}) + "\n")
+            f.writelines(
+                self._log_entry(row, point_id, self.payloads[row])
+                for row, point_id in enumerate(self.ids) if point_id is not None
+            )
+        os.replace(tmp, self._log_path)
+        self._log_lines = len(self.id_to_row)
+        self._log_offset = os.path.getsize(self._log_path)
+        self._seen = self._log_state()
+
+    def _source_code(self, source: Optional[str]) -> int:
+        if source not in self.source_codes:
+            self.source_codes[source] = len(self.source_codes)
+        return self.source_codes[source]
+
+    # --- Writes ---
+    def upsert(self, ids: List[str], vectors: List[List[float]], payloads: List[Dict]):
+        batch = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(batch, axis=1, keepdims=True)
+        batch = batch / np.where(norms == 0, 1, norms)
+
+        with self._writing():
+            rows = []
+            for point_id, payload in zip(ids, payloads):
+                row = self.id_to_row.get(point_id)
+                if row is None:
+                    row = self.free_rows.pop() if self.free_rows else len(self.ids)
+                    if row == len(self.ids):
+                        self.ids.append(None)
+                        self.payloads.append(None)
+                    self.id_to_row[point_id] = row
+                rows.append(row)
+                self.ids[row] = point_id
+                self.payloads[row] = payload
+
+            self._grow(len(self.ids))
+            rows = np.asarray(rows)
+            self.matrix[rows] = batch.astype(self.dtype)
+            self.alive[rows] = True
+            self.sources[rows] = [self._source_code(p.get("source")) for p in payloads]
+            if self._hnsw is not None:
+                self._hnsw.add_items(batch, rows)
+            self._save(rows.tolist())
+
+    def delete_rows(self, rows: List[int]):
+        with self._writing():
+            deleted = []
+            for row in rows:
+                point_id = self.ids[row]
+                if point_id is None:
+                    continue
+                deleted.append(row)
+                del self.id_to_row[point_id]
+                self.ids[row] = None
+                self.payloads[row] = None
+                self.alive[row] = False
+                self.sources[row] = -1
+                self.free_rows.append(row)
+                if self._hnsw is not None:
+                    self._hnsw.mark_deleted(row)
+            if deleted:
+                self._save(deleted)
+
+    def delete_sources(self, sources: List[str]) -> int:
+        with self._writing():
+            rows = np.flatnonzero(self._source_mask(sources)).tolist()
+            self.delete_rows(rows)
+            return len(rows)
+
+    def delete_stale_versions(self, source: str, version: str) -> int:
+        with self._writing():
+            rows = [
+                row for row in np.flatnonzero(self._source_mask([source])).tolist()
+                if self.payloads[row].get("doc_version") != version
+            ]
+            self.delete_rows(rows)
+            return len(rows)
+
+    def reset(self):
+        with self._writing():
+            self.delete_rows([row for row, point_id in enumerate(self.ids) if point_id is not None])
+
+    # --- Search ---
+    def _source_mask(self, sources: List[str]) -> np.ndarray:
+        codes = [self.source_codes[s] for s in sources if s in self.source_codes]
+        return np.isin(self.sources, codes) & self.alive
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        Cosine scores of every used row. The memmap is read in contiguous
+        slices (no fancy-index copy of the matrix) and each slice is upcast to
+        float32 before the product, so float16 storage keeps float32 accuracy.
+        """
+        n = len(self.ids)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + SCORE_BLOCK_ROWS][:n - start], dtype=np.float32)
+            scores[start:start + block.shape[0]] = block @ query
+        return scores
+
+    def _top_k(self, scores: np.ndarray, mask: np.ndarray, k: int) -> List[LocalHit]:
+        mask = mask[:scores.size]
+        candidates = int(np.count_nonzero(mask))
+        if not candidates or k <= 0:
+            return []
+        scores = np.where(mask, scores, -np.inf)
+        k = min(k, candidates)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [LocalHit(id=self.ids[row], score=float(scores[row]), payload=self.payloads[row]) for row in top]
+
+    def _hnsw_index(self):
+        if self._hnsw is None and self.hnsw_threshold and len(self.id_to_row) >= self.hnsw_threshold:
+            try:
+                import hnswlib
+            except ImportError:
+                return None
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.init_index(max_elements=self.matrix.shape[0], ef_construction=200, M=16)
+            for start in range(0, len(self.ids), SCORE_BLOCK_ROWS):
+                rows = start + np.flatnonzero(self.alive[start:min(start + SCORE_BLOCK_ROWS, len(self.ids))])
+                if rows.size:
+                    index.add_items(np.asarray(self.matrix[rows], dtype=np.float32), rows)
+            index.set_ef(128)
+            print(f"[LocalIndex] Built HNSW graph over {len(self.id_to_row)} vectors")
+            self._hnsw = index
+        return self._hnsw
+
+    def search(self, query_embedding: List[float], k: int = 5, sources: List[str] = None,
+               per_source_k: int = None) -> List[LocalHit]:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+
+        with self._lock:
+            self._sync()
+            if sources and per_source_k:
+                scores = self._scores(query)
+                hits = []
+                for source in sources:
+                    hits.extend(self._top_k(scores, self._source_mask([source]), per_source_k))
+                return sorted(hits, key=lambda h: h.score, reverse=True)
+
+            if sources:
+                return self._top_k(self._scores(query), self._source_mask(sources), k)
+
+            hnsw = self._hnsw_index()
+            if hnsw is not None:
+                labels, distances = hnsw.knn_query(query, k=min(k, len(self.id_to_row)))
+                # hnswlib's "ip" space returns 1 - dot product
+                return [
+                    LocalHit(id=self.ids[row], score=float(1 - dist), payload=self.payloads[row])
+                    for row, dist in zip(labels[0], distances[0])
+                ]
+            return self._top_k(self._scores(query), self.alive, k)
+
+    def get_payloads(self, ids: List[str]) -> Dict[str, Dict]:
+        with self._lock:
+            self._sync()
+            return {pid: self.payloads[self.id_to_row[pid]] for pid in ids if pid in self.id_to_row}
+
+    def count(self) -> int:
+        with self._lock:
+            self._sync()
+            return len(self.id_to_row)
@@ -1,14 +1,25 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List
-from app.ingestion.ingestion_pipeline import process_documents
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from app.config import Config
+from app.embedders import get_embedder
+from app.ingestion.extract import (
+    iter_nodes, iter_nodes_in_subprocess, shutdown_extraction, submit_extraction, uses_page_pool
+)
+from app.ingestion.ingestion_pipeline import index_nodes, stream_index
+from app.ingestion.bulk_ingest import bulk_ingest
+from app.jobs import job_manager, Job
 from app.query import router as query_router
-from app.vectorstore import upsert_vectors, ensure_collection, delete_vectors_by_source
-import boto3, os, logging
+from app.vectorstore import ensure_collection, delete_vectors_by_sources, async_client
+from app.ollama_client import ollama
+import asyncio, boto3, os, logging, multiprocessing, shutil, tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
+config = Config()
 
 # ENV Configs
 MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT")  # e.g. 127.0.0.1:9000
@@ -16,11 +27,38 @@ ACCESS_KEY = os.getenv("ACCESS_KEY")
 SECRET_KEY = os.getenv("SECRET_KEY")
 BUCKET_NAME = os.getenv("BUCKET_NAME")
 
+# CPU-bound extraction runs in worker processes so it never blocks the event loop.
+# "spawn" keeps workers free of the parent's gRPC/HTTP client threads. PDFs are
+# extracted from this process instead, so their pages can use the shared page pool.
+extraction_pool = ProcessPoolExecutor(
+    max_workers=config.EXTRACTION_WORKERS,
+    mp_context=multiprocessing.get_context("spawn")
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the collection and its payload indexes, and set up the embedder, before serving traffic
+    await asyncio.to_thread(ensure_collection)
+    await asyncio.to_thread(get_embedder)
+    if config.OLLAMA_WARM_UP:
+        try:
+            await ollama.awarm_up()
+        except Exception as e:
+            # Serve anyway; the first query will pay the model load instead
+            logging.warning(f"⚠️ Could not warm up Ollama model '{config.LLM_MODEL}': {e}")
+    yield
+    await ollama.aclose()
+    if async_client is not None:
+        await async_client.close()
+    job_manager.shutdown()
+    extraction_pool.shutdown(wait=False, cancel_futures=True)
+    shutdown_extraction()
+
 # App
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(query_router)
 
-# MinIO client
+# MinIO client (boto3 is blocking; every call goes through asyncio.to_thread)
 s3 = boto3.client(
     "s3",
     endpoint_url=f"http://{MINIO_ENDPOINT}",
@@ -32,33 +70,67 @@ s3 = boto3.client(
 async def upload(file: UploadFile = File(...)):
     try:
         object_name = file.filename
-        s3.upload_fileobj(file.file, BUCKET_NAME, object_name)
+        await asyncio.to_thread(s3.upload_fileobj, file.file, BUCKET_NAME, object_name)
     except Exception as e:
         return {"error": f"❌ Failed to upload to MinIO: {e}"}
 
-    return await ingest_from_minio(MinIOIngestRequest(bucket=BUCKET_NAME, object_name=object_name))
+    return submit_ingest_job(BUCKET_NAME, object_name)
 
 class DeleteDocumentsRequest(BaseModel):
     object_names: List[str]
 
+# S3 DeleteObjects accepts at most 1000 keys per call
+S3_DELETE_BATCH = 1000
+
 @app.delete("/delete_documents")
 async def delete_documents(payload: DeleteDocumentsRequest):
-    deleted = []
-    errors = []
+    object_names = list(dict.fromkeys(payload.object_names))
+    results = {name: {"file": name, "minio": None, "vectors": None} for name in object_names}
 
-    for object_name in payload.object_names:
+    # --- MinIO: batch delete ---
+    for i in range(0, len(object_names), S3_DELETE_BATCH):
+        batch = object_names[i:i + S3_DELETE_BATCH]
         try:
-            s3.delete_object(Bucket=BUCKET_NAME, Key=object_name)
-            delete_vectors_by_source(object_name)
-            deleted.append(object_name)
-            logging.info(f"🗑️ Deleted '{object_name}' from MinIO and Qdrant.")
+            response = await asyncio.to_thread(
+                s3.delete_objects,
+                Bucket=BUCKET_NAME,
+                Delete={"Objects": [{"Key": name} for name in batch]}
+            )
+            for item in response.get("Deleted", []):
+                results[item["Key"]]["minio"] = "deleted"
+            for item in response.get("Errors", []):
+                results[item["Key"]]["minio"] = f"{item.get('Code')}: {item.get('Message')}"
         except Exception as e:
-            logging.error(f"❌ Failed to delete '{object_name}': {e}")
-            errors.append({"file": object_name, "error": str(e)})
+            logging.error(f"❌ MinIO batch delete failed: {e}")
+            for name in batch:
+                results[name]["minio"] = str(e)
+
+    # --- Qdrant: one filter delete for every file removed from MinIO ---
+    removed = [name for name in object_names if results[name]["minio"] == "deleted"]
+    try:
+        await asyncio.to_thread(delete_vectors_by_sources, removed)
+        for name in removed:
+            results[name]["vectors"] = "deleted"
+    except Exception as e:
+        logging.error(f"❌ Qdrant delete failed: {e}")
+        for name in removed:
+            results[name]["vectors"] = str(e)
+
+    deleted = []
+    errors = []
+    for name, result in results.items():
+        if result["minio"] == "deleted" and result["vectors"] == "deleted":
+            deleted.append(name)
+            logging.info(f"🗑️ Deleted '{name}' from MinIO and Qdrant.")
+        else:
+            error = (result["minio"] if result["minio"] != "deleted" else result["vectors"]) or "not confirmed by MinIO"
+            logging.error(f"❌ Failed to delete '{name}': {error}")
+            errors.append({"file": name, "error": error})
 
     return {
         "deleted": deleted,
         "errors": errors,
+        "results": list(results.values()),
         "message": f"🧹 Deleted {len(deleted)} file(s), {len(errors)} error(s)."
     }
 
@@ -66,34 +138,127 @@ class MinIOIngestRequest(BaseModel):
     bucket: str
     object_name: str
 
-@app.post("/ingest_from_minio")
+@app.post("/ingest_from_minio", status_code=202)
 async def ingest_from_minio(req: MinIOIngestRequest):
-    os.makedirs("minio_downloads", exist_ok=True)
-    local_path = os.path.join("minio_downloads", req.object_name)
-    ensure_collection()
+    return submit_ingest_job(req.bucket, req.object_name)
 
+def submit_ingest_job(bucket: str, object_name: str):
+    job = job_manager.submit("ingest", {"bucket": bucket, "object_name": object_name}, run_ingest_job)
+    return {"job_id": job.id, "status": job.status, "message": f"📥 Queued ingestion of '{object_name}'"}
+
+def run_ingest_job(job: Job) -> str:
+    """Download, extract, embed and upsert one MinIO object. Runs on a job worker thread."""
+    bucket, object_name = job.params["bucket"], job.params["object_name"]
+    # Each job downloads into its own directory, so concurrent jobs for the same
+    # object never share a file; only the base name is kept, so keys can't escape it
+    file_name = os.path.basename(object_name)
+    if file_name in ("", ".", ".."):
+        raise Exception(f"Invalid object name: '{object_name}'")
+    workdir = tempfile.mkdtemp(prefix=f"ingest_{job.id}_")
     try:
-        s3.download_file(req.bucket, req.object_name, local_path)
-    except Exception as e:
-        return {"error": f"❌ Failed to download from MinIO: {e}"}
+        return _ingest_object(job, bucket, object_name, os.path.join(workdir, file_name))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _ingest_object(job: Job, bucket: str, object_name: str, local_path: str) -> str:
+    ensure_collection()
 
+    job.update("downloading")
     try:
-        print(f"🚀 Starting ingestion for: {local_path}")
-        vectors = process_documents(local_path)
-        if not vectors:
-            return {"error": f"⚠️ No vectors extracted from '{req.object_name}'"}
-
-        print(f"🧠 Extracted {len(vectors)} vectors.")
-        upsert_vectors(vectors)
-        return {"message": f"✅ {len(vectors)} chunks embedded from '{req.object_name}'"}
+        head = s3.head_object(Bucket=bucket, Key=object_name)
+        etag = head["ETag"].strip('"')
+        size = head.get("ContentLength", 0)
+        # Large files stream through extract → embed → upsert with bounded memory.
+        # Smaller PDFs are extracted straight from memory; everything else goes through a local file.
+        streaming = size >= config.STREAM_INGEST_MIN_BYTES
+        in_memory = not streaming and object_name.lower().endswith(".pdf")
+        if in_memory:
+            data = s3.get_object(Bucket=bucket, Key=object_name, IfMatch=head["ETag"])["Body"].read()
+        else:
+            s3.download_file(bucket, object_name, local_path)
     except Exception as e:
-        return {"error": f"❌ Failed to process document: {e}"}
+        raise Exception(f"Failed to download from MinIO: {e}")
+    job.update(downloaded_bytes=size)
+
+    print(f"🚀 Starting ingestion for: {object_name}")
+    if streaming:
+        if uses_page_pool(local_path):
+            # A long PDF's pages are scanned in the page pool; this thread only chunks them
+            chunks = iter_nodes(local_path, parallel_pages=True)
+        else:
+            chunks = iter_nodes_in_subprocess(local_path, max_batches=config.STREAM_QUEUE_BATCHES)
+        counters = stream_index(chunks, object_name, etag, progress=job.update)
+        if not counters["points_upserted"]:
+            raise Exception(f"No vectors extracted from '{object_name}'")
+        return f"✅ {counters['points_upserted']} chunks embedded from '{object_name}' (streamed)"
+
+    job.update("extracting")
+    if in_memory:
+        nodes = submit_extraction(extraction_pool, object_name, data).result()
+    else:
+        nodes = submit_extraction(extraction_pool, local_path).result()
+    job.update(chunks_extracted=len(nodes))
+
+    # index_nodes keys the points by the object's ETag and reports embedding/upsert progress
+    vectors = index_nodes(nodes, object_name, etag, progress=job.update)
+    if not vectors:
+        raise Exception(f"No vectors extracted from '{object_name}'")
+
+    print(f"🧠 Extracted {len(vectors)} vectors.")
+    return f"✅ {len(vectors)} chunks embedded from '{object_name}'"
+
+
+class BulkIngestRequest(BaseModel):
+    bucket: str | None = None  # defaults to BUCKET_NAME
+    prefix: str = ""
+    force: bool = False  # re-ingest objects whose ETag is already indexed
+
+@app.post("/ingest_bulk", status_code=202)
+async def ingest_bulk(req: BulkIngestRequest):
+    """Queue a job that ingests every supported object under bucket/prefix."""
+    params = {"bucket": req.bucket or BUCKET_NAME, "prefix": req.prefix, "force": req.force}
+    job = job_manager.submit("bulk_ingest", params, run_bulk_ingest_job)
+    return {"job_id": job.id, "status": job.status, "message": f"📥 Queued bulk ingestion of '{params['bucket']}/{req.prefix}'"}
+
+def run_bulk_ingest_job(job: Job) -> str:
+    report = bulk_ingest(
+        bucket=job.params["bucket"],
+        prefix=job.params["prefix"],
+        s3=s3,
+        extraction_pool=extraction_pool,
+        skip_unchanged=not job.params["force"],
+        progress=job.update
+    )
+    job.update(report=report)
+    return (f"✅ {report['files_ingested']} file(s), {report['chunks']} chunk(s) in {report['elapsed_sec']} s "
+            f"({report['files_per_sec']} files/sec), {report['files_failed']} failed")
+
+
+@app.get("/jobs")
+async def list_jobs(limit: int = 50):
+    return {"jobs": [job.to_dict() for job in job_manager.list(limit)], "counts": job_manager.stats()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict()
+
+@app.post("/jobs/{job_id}/retry", status_code=202)
+async def retry_job(job_id: str):
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    job = job_manager.retry(job_id)
+    if job is None:
+        raise HTTPException(status_code=409, detail="Only failed jobs can be retried.")
+    return {"job_id": job.id, "status": job.status, "attempts": job.attempts}
 
 
 @app.get("/list_documents")
 async def list_documents():
     try:
-        response = s3.list_objects_v2(Bucket=BUCKET_NAME)
+        response = await asyncio.to_thread(s3.list_objects_v2, Bucket=BUCKET_NAME)
         contents = response.get("Contents", [])
         if not contents:
             return {"files": []}  # ✅ Return empty list when bucket is empty
@@ -1,14 +1,168 @@
+import json
+import logging
 import requests
+import httpx
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from app.config import Config
 
 config = Config()
+logger = logging.getLogger(__name__)
+
+# Ollama reports durations in nanoseconds
+TIMING_FIELDS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+COUNT_FIELDS = ("prompt_eval_count", "eval_count")
+
+
+@dataclass
+class OllamaResult:
+    text: str
+    model: str
+    timings: Dict  # *_ms durations and token counts from Ollama's final response
+
+
+def extract_timings(body: Dict) -> Dict:
+    """Pick Ollama's timing fields out of a final response, durations converted to ms."""
+    timings = {f.replace("_duration", "_ms"): round(body[f] / 1e6, 1) for f in TIMING_FIELDS if f in body}
+    timings.update({f: body[f] for f in COUNT_FIELDS if f in body})
+    if body.get("eval_count") and body.get("eval_duration"):
+        timings["tokens_per_sec"] = round(body["eval_count"] / (body["eval_duration"] / 1e9), 1)
+    return timings
+
+
+class OllamaClient:
+    """
+    Reusable client for the Ollama generate API.
+
+    Sync calls share a pooled requests.Session that retries connection errors
+    and 502/503/504; async calls share one httpx.AsyncClient (created on first
+    use inside the event loop). Every request sends keep_alive, so the model
+    stays loaded between queries instead of being reloaded after idle.
+    """
+
+    def __init__(self, base_url: str = config.OLLAMA_URL, model: str = config.LLM_MODEL,
+                 keep_alive: str = config.OLLAMA_KEEP_ALIVE, timeout: float = config.OLLAMA_TIMEOUT,
+                 max_retries: int = config.OLLAMA_MAX_RETRIES, pool_size: int = config.OLLAMA_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.generate_url = f"{self.base_url}/api/generate"
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_http: Optional[httpx.AsyncClient] = None
+
+    def _payload(self, prompt: str, model: str = None, stream: bool = False, system_prompt: str = None) -> Dict:
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+        }
+        if system_prompt:
+            payload["system"] = system_prompt
+        return payload
+
+    def _async_client(self) -> httpx.AsyncClient:
+        if self._async_http is None:
+            # Transport retries cover connection failures; Ollama answers are not retried blindly
+            self._async_http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                transport=httpx.AsyncHTTPTransport(retries=self.max_retries)
+            )
+        return self._async_http
+
+    # --- Sync ---
+    def generate(self, prompt: str, model: str = None, system_prompt: str = None) -> OllamaResult:
+        res = self.session.post(self.generate_url, json=self._payload(prompt, model, False, system_prompt), timeout=self.timeout)
+        if not res.ok:
+            raise Exception(f"Ollama returned {res.status_code}: {res.text}")
+        body = res.json()
+        return OllamaResult(text=body.get("response", "").strip(), model=body.get("model", model or self.model), timings=extract_timings(body))
+
+    def stream(self, prompt: str, model: str = None, system_prompt: str = None):
+        """Yield Ollama's NDJSON chunks as dicts; the last one has done=True and the timing fields."""
+        payload = self._payload(prompt, model, True, system_prompt)
+        with self.session.post(self.generate_url, json=payload, timeout=self.timeout, stream=True) as res:
+            if not res.ok:
+                raise Exception(f"Ollama returned {res.status_code}: {res.text}")
+            for line in res.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise Exception(f"Ollama error: {chunk['error']}")
+                yield chunk
+                if chunk.get("done"):
+                    break
+
+    # --- Async ---
+    async def agenerate(self, prompt: str, model: str = None, system_prompt: str = None) -> OllamaResult:
+        res = await self._async_client().post(self.generate_url, json=self._payload(prompt, model, False, system_prompt))
+        if res.is_error:
+            raise Exception(f"Ollama returned {res.status_code}: {res.text}")
+        body = res.json()
+        return OllamaResult(text=body.get("response", "").strip(), model=body.get("model", model or self.model), timings=extract_timings(body))
+
+    async def astream(self, prompt: str, model: str = None, system_prompt: str = None) -> AsyncIterator[Dict]:
+        """Async variant of stream(): yields NDJSON chunks as Ollama produces them."""
+        payload = self._payload(prompt, model, True, system_prompt)
+        async with self._async_client().stream("POST", self.generate_url, json=payload) as res:
+            if res.is_error:
+                body = await res.aread()
+                raise Exception(f"Ollama returned {res.status_code}: {body.decode('utf-8', 'replace')}")
+            async for line in res.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise Exception(f"Ollama error: {chunk['error']}")
+                yield chunk
+                if chunk.get("done"):
+                    break
+
+    async def awarm_up(self, model: str = None) -> Dict:
+        """
+        Load the model into memory ahead of the first query. A generate request
+        without a prompt only loads the model and applies keep_alive.
+        """
+        model = model or self.model
+        res = await self._async_client().post(self.generate_url, json={"model": model, "keep_alive": self.keep_alive})
+        if res.is_error:
+            raise Exception(f"Ollama returned {res.status_code}: {res.text}")
+        timings = extract_timings(res.json())
+        print(f"🔥 [Ollama] '{model}' loaded (keep_alive={self.keep_alive}, load {timings.get('load_ms', 0)} ms)")
+        return timings
+
+    async def aclose(self):
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+        self.session.close()
+
+
+ollama = OllamaClient()
 
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
 
 def query_ollama(prompt: str, model: str = config.LLM_MODEL, stream: bool = False, system_prompt: str = None) -> str:
     """
     Send a prompt to the local Ollama server and get the model's response.
-    
+
     Args:
         prompt (str): The user question or input.
         model (str): Model name loaded in Ollama.
@@ -18,30 +172,10 @@ def query_ollama(prompt: str, model: str = config.LLM_MODEL, stream: bool = Fals
     Returns:
         str: The generated response text.
     """
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": stream,
-    }
-    
-    if system_prompt:
-        payload["system"] = system_prompt
-
     try:
-        res = requests.post(OLLAMA_API_URL, json=payload, timeout=120)
-
-        if not res.ok:
-            raise Exception(f"Ollama returned {res.status_code}: {res.text}")
-
         if stream:
-            response_text = ""
-            for line in res.iter_lines():
-                if line:
-                    chunk = line.decode("utf-8").strip()
-                    response_text += chunk
-            return response_text
-        else:
-            return res.json().get("response", "").strip()
+            return "".join(chunk.get("response", "") for chunk in ollama.stream(prompt, model, system_prompt)).strip()
+        return ollama.generate(prompt, model, system_prompt).text
 
     except Exception as e:
         return f"❌ Error querying Ollama: {e}"
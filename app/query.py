@@ -1,18 +1,39 @@
+import json
+import asyncio
+import httpx
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from nomic import embed
-from app.vectorstore import search_similar
-from app.ollama_client import query_ollama
+from app.embedding import aembed_query, aembed_queries
+from app.embedding_cache import QueryEmbeddingCache
+from app.vectorstore import asearch_similar, asearch_similar_batch, aretrieve_payloads
+from app.sparse_index import sparse_index, reciprocal_rank_fusion
+from app.ollama_client import ollama, extract_timings
+from app.answer_cache import answer_cache
+from app.context_packer import context_packer
+from app.llm_scheduler import llm_scheduler, LLMOverloaded, LLMQueueFull, INTERACTIVE, BATCH
+from app.single_flight import SingleFlight, StreamFanout
 from app.config import Config
 
 config = Config()
 router = APIRouter()
 
+# Identical requests in flight at the same time share one embed → search → generate run
+query_flights = SingleFlight()
+stream_fanout = StreamFanout()
+
 
 # --- ✅ Request Schema ---
 class QueryRequest(BaseModel):
     question: str
     documents: list[str] | None = None  # Optional filter by filenames
+    mode: str | None = None  # "hybrid" | "dense" | "keyword", defaults to Config.RETRIEVAL_MODE
+
+
+class BatchQueryRequest(BaseModel):
+    questions: list[str]
+    documents: list[str] | None = None  # Same filter applied to every question
+    mode: str | None = None
 
 
 # --- ✅ Response Schema (optional, for stricter typing) ---
@@ -23,39 +44,161 @@ class Citation(BaseModel):
     page_number: str | int
 
 
-# --- ✅ Query Endpoint ---
-@router.post("/query")
-def ask_question(req: QueryRequest):
-    if not req.question.strip():
-        raise HTTPException(status_code=400, detail="Question field is required.")
+# --- ✅ Retrieval: dense, BM25 keyword, or both fused with RRF ---
+def _retrieval_plan(documents: list[str] | None, mode: str | None):
+    """Resolve (mode, documents, per_doc_k, limit) from the request and Config."""
+    mode = (mode or config.RETRIEVAL_MODE).lower()
+    if mode not in ("hybrid", "dense", "keyword"):
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval mode: {mode}")
+    if sparse_index is None:
+        mode = "dense"
 
-    # --- Step 1: Embed question ---
-    try:
-        q_embed = embed.text([req.question], model=config.EMBED_MODEL)["embeddings"][0]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Embedding failed: {e}")
+    documents = documents or None
+    # The per-document quota only applies to a document filter
+    per_doc_k = (config.PER_DOCUMENT_TOP_K or None) if documents else None
+    limit = per_doc_k * len(documents) if per_doc_k else config.SEARCH_TOP_K
+    return mode, documents, per_doc_k, limit
 
-    # --- Step 2: Search in vector DB ---
-    try:
-        matches = search_similar(q_embed, k=4)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Vector search failed: {e}")
+async def with_payloads(hits):
+    """
+    Fill in full payloads for keyword hits, which carry only source and version.
+    Hits whose point has since been deleted are dropped.
+    """
+    missing = [str(h.id) for h in hits if "text" not in (h.payload or {})]
+    if not missing:
+        return hits
+    payloads = await aretrieve_payloads(missing)
+    for hit in hits:
+        if str(hit.id) in payloads:
+            hit.payload = payloads[str(hit.id)]
+    return [h for h in hits if "text" in (h.payload or {})]
 
-    if not matches:
-        return {
-            "answer_with_refs": "❌ No relevant documents found.",
-            "citations": []
-        }
+async def retrieve(question: str, documents: list[str] | None = None, mode: str | None = None):
+    mode, documents, per_doc_k, limit = _retrieval_plan(documents, mode)
+
+    # Keyword-only queries never touch the embedding API
+    if mode == "keyword":
+        return await with_payloads(await asyncio.to_thread(sparse_index.search, question, limit, documents))
+
+    async def dense(k):
+        q_embed = await aembed_query(question)
+        return await asearch_similar(q_embed, k=k, filter_docs=documents, per_doc_k=per_doc_k)
+
+    if mode == "dense":
+        return await dense(config.SEARCH_TOP_K)
+
+    dense_hits, sparse_hits = await asyncio.gather(
+        dense(config.HYBRID_CANDIDATES),
+        asyncio.to_thread(sparse_index.search, question, config.HYBRID_CANDIDATES, documents)
+    )
+    fused = reciprocal_rank_fusion([dense_hits, sparse_hits], k=limit, rrf_k=config.RRF_K, per_source_k=per_doc_k)
+    return await with_payloads(fused)
+
+async def retrieve_batch(questions: list[str], documents: list[str] | None = None, mode: str | None = None,
+                         embeddings: list | None = None):
+    """
+    Retrieve for many questions at once: one embedding call for all of them and
+    one batched vector search, with BM25 lookups running alongside. Pass
+    `embeddings` when the questions are already embedded.
+    """
+    mode, documents, per_doc_k, limit = _retrieval_plan(documents, mode)
+
+    async def sparse(question, k):
+        return await asyncio.to_thread(sparse_index.search, question, k, documents)
+
+    if mode == "keyword":
+        async def keyword(question):
+            return await with_payloads(await sparse(question, limit))
+        return list(await asyncio.gather(*(keyword(q) for q in questions)))
+
+    k = config.SEARCH_TOP_K if mode == "dense" else config.HYBRID_CANDIDATES
+    if embeddings is None:
+        embeddings = await aembed_queries(questions)
+    dense_search = asearch_similar_batch(embeddings, k=k, filter_docs=documents, per_doc_k=per_doc_k)
+    if mode == "dense":
+        return await dense_search
+
+    dense_hits, sparse_hits = await asyncio.gather(
+        dense_search,
+        asyncio.gather(*(sparse(q, config.HYBRID_CANDIDATES) for q in questions))
+    )
+    return list(await asyncio.gather(*(
+        with_payloads(reciprocal_rank_fusion([d, s], k=limit, rrf_k=config.RRF_K, per_source_k=per_doc_k))
+        for d, s in zip(dense_hits, sparse_hits)
+    )))
 
-    # --- Step 3: Prepare context with citations ---
+
+# --- ✅ Semantic answer cache ---
+async def lookup_cached_answer(question: str, documents: list[str] | None, mode: str | None):
+    """
+    Return (scope, embedding, hit) for the answer cache. scope is None when the
+    cache does not apply: it is disabled, or the query is keyword-only (which
+    never embeds the question). hit is (answer, similarity) or None.
+    """
+    mode = _retrieval_plan(documents, mode)[0]
+    if answer_cache is None or mode == "keyword":
+        return None, None, None
+    embedding = await aembed_query(question)
+    scope = await asyncio.to_thread(answer_cache.scope_key, documents, mode)
+    return scope, embedding, answer_cache.get(scope, embedding)
+
+async def lookup_cached_answers(questions: list[str], documents: list[str] | None, mode: str | None):
+    """
+    Batch form of lookup_cached_answer: one embedding call for every question,
+    returning (scope, embeddings, hits) with one hit (or None) per question.
+    """
+    mode = _retrieval_plan(documents, mode)[0]
+    if answer_cache is None or mode == "keyword":
+        return None, None, [None] * len(questions)
+    embeddings = await aembed_queries(questions)
+    scope = await asyncio.to_thread(answer_cache.scope_key, documents, mode)
+    return scope, embeddings, [answer_cache.get(scope, embedding) for embedding in embeddings]
+
+def cached_response(hit) -> dict:
+    answer, similarity = hit
+    return {**answer, "cached": True, "similarity": round(similarity, 4)}
+
+def store_answer(scope, question: str, embedding, result: dict):
+    # "No relevant documents" answers are not worth keeping
+    if scope is not None and result.get("citations"):
+        answer_cache.put(scope, question, embedding, result)
+
+
+@router.get("/query/cache/stats")
+async def answer_cache_stats():
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **answer_cache.stats()}
+
+@router.get("/query/llm/stats")
+async def llm_scheduler_stats():
+    return {**llm_scheduler.stats(), "coalescing": {**query_flights.stats(), **stream_fanout.stats()}}
+
+
+def coalesce_key(question: str, documents: list[str] | None, mode: str | None):
+    """Requests with the same normalized question, document filter and mode get the same answer."""
+    return (
+        QueryEmbeddingCache.normalize(question),
+        tuple(sorted(set(documents))) if documents else None,
+        (mode or config.RETRIEVAL_MODE).lower()
+    )
+
+
+# --- ✅ Context, prompt and generation ---
+def build_context(matches):
+    """
+    Pack the best matches into the context token budget and number them.
+    Returns (citations, numbered_context, usage) where usage reports the tokens spent.
+    """
+    packed = context_packer.pack(matches)
     citations = []
     numbered_context = ""
-    for idx, match in enumerate(matches, 1):
-        payload = match.payload or {}
+    for idx, chunk in enumerate(packed.chunks, 1):
+        payload = chunk.match.payload or {}
 
-        text = payload.get("text", "")
+        text = chunk.text
         source = payload.get("source", "unknown")
-        page = payload.get("page_number", "?")
+        page = payload.get("page_number", payload.get("page_num", "?"))
 
         citations.append({
             "index": idx,
@@ -65,9 +208,10 @@ def ask_question(req: QueryRequest):
         })
 
         numbered_context += f"[{idx}] {text}\n\n"
+    return citations, numbered_context, packed.usage()
 
-    # --- Step 4: Construct prompt for LLM ---
-    prompt = f"""You are a knowledgeable document chatbot. Use only the numbered context documents below to answer the user's question as accurately and concisely as possible. 
+def build_prompt(question: str, numbered_context: str) -> str:
+    return f"""You are a knowledgeable document chatbot. Use only the numbered context documents below to answer the user's question as accurately and concisely as possible. 
     If you reference specific information, cite the relevant reference number(s) in square brackets, like [1], [2], etc. 
     If the information is not available in the context, politely say so.
 
@@ -75,16 +219,220 @@ def ask_question(req: QueryRequest):
     {numbered_context}
 
     Question:
-    {req.question}
+    {question}
     """
 
-    # --- Step 5: Query LLM ---
+def llm_error(e: Exception) -> HTTPException:
+    """Map a failed or refused generation to an honest status code."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, LLMOverloaded):
+        return HTTPException(
+            status_code=429 if isinstance(e, LLMQueueFull) else 503,
+            detail={"message": e.reason, "queue_depth": e.queue_depth, "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after), "X-Queue-Depth": str(e.queue_depth)}
+        )
+    if isinstance(e, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail=f"LLM timed out: {e}")
+    if isinstance(e, httpx.TransportError):
+        return HTTPException(status_code=503, detail=f"LLM is unreachable: {e}")
+    return HTTPException(status_code=502, detail=f"LLM query failed: {e}")
+
+async def generate_answer(question: str, matches, priority: int = INTERACTIVE):
+    if not matches:
+        return {
+            "answer_with_refs": "❌ No relevant documents found.",
+            "citations": []
+        }
+
+    citations, numbered_context, usage = build_context(matches)
+    prompt = build_prompt(question, numbered_context)
+
     try:
-        answer = query_ollama(prompt=prompt, model="llama3.2:1b")
+        async with await llm_scheduler.acquire(priority):
+            result = await ollama.agenerate(prompt=prompt, model=config.LLM_MODEL)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"LLM query failed: {e}")
+        raise llm_error(e)
 
     return {
-        "answer_with_refs": answer.strip(),
-        "citations": citations
+        "answer_with_refs": result.text,
+        "citations": citations,
+        "timings": result.timings,
+        "context": usage
     }
+
+
+# --- ✅ Query Endpoint ---
+@router.post("/query")
+async def ask_question(req: QueryRequest):
+    if not req.question.strip():
+        raise HTTPException(status_code=400, detail="Question field is required.")
+
+    key = coalesce_key(req.question, req.documents, req.mode)
+    return await query_flights.do(key, lambda: answer_question(req))
+
+async def answer_question(req: QueryRequest):
+    # --- Step 1 & 2: Embed question, reuse a cached answer to a paraphrase, or search (dense / keyword / hybrid) ---
+    try:
+        scope, embedding, hit = await lookup_cached_answer(req.question, req.documents, req.mode)
+        if hit:
+            return cached_response(hit)
+        matches = await retrieve(req.question, req.documents, req.mode)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Retrieval failed: {e}")
+
+    # --- Step 3-5: Build cited context, prompt the LLM ---
+    result = await generate_answer(req.question, matches)
+    store_answer(scope, req.question, embedding, result)
+    return result
+
+
+# --- ✅ Streaming Query Endpoint (Server-Sent Events) ---
+def sse_event(event: str, data) -> str:
+    # JSON-encode the data so tokens containing newlines stay on one "data:" line
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/query/stream")
+async def ask_question_stream(req: QueryRequest):
+    """
+    Same pipeline as /query, streamed as SSE: a "citations" event first, then one
+    "token" event per generated token, then "done" with Ollama's timings (or "error").
+    Identical requests arriving while a stream runs join it and receive every event.
+    """
+    if not req.question.strip():
+        raise HTTPException(status_code=400, detail="Question field is required.")
+
+    key = coalesce_key(req.question, req.documents, req.mode)
+    events = await stream_fanout.subscribe(key, lambda: start_answer_stream(req))
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def start_answer_stream(req: QueryRequest):
+    """Retrieve and take an LLM slot (raising HTTP errors), then return the SSE event generator."""
+    try:
+        scope, embedding, hit = await lookup_cached_answer(req.question, req.documents, req.mode)
+        matches = None if hit else await retrieve(req.question, req.documents, req.mode)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Retrieval failed: {e}")
+
+    # Take an LLM slot before the response starts, so overload is still a real 429/503
+    slot = None
+    if not hit and matches:
+        try:
+            slot = await llm_scheduler.acquire(INTERACTIVE)
+        except Exception as e:
+            raise llm_error(e)
+
+    async def events():
+        # The slot must be returned however the stream ends: error, disconnect or cancellation
+        try:
+            if hit:
+                cached = cached_response(hit)
+                yield sse_event("citations", cached["citations"])
+                yield sse_event("token", {"token": cached["answer_with_refs"]})
+                yield sse_event("done", {"timings": cached.get("timings", {}), "cached": True, "similarity": cached["similarity"]})
+                return
+
+            if not matches:
+                yield sse_event("citations", [])
+                yield sse_event("token", {"token": "❌ No relevant documents found."})
+                yield sse_event("done", {})
+                return
+
+            citations, numbered_context, usage = build_context(matches)
+            yield sse_event("citations", citations)
+            timings, tokens = {}, []
+            try:
+                async for chunk in ollama.astream(build_prompt(req.question, numbered_context), model=config.LLM_MODEL):
+                    if chunk.get("response"):
+                        tokens.append(chunk["response"])
+                        yield sse_event("token", {"token": chunk["response"]})
+                    if chunk.get("done"):
+                        timings = extract_timings(chunk)
+            except Exception as e:
+                error = llm_error(e)
+                yield sse_event("error", {"status": error.status_code, "detail": error.detail})
+                return
+            finally:
+                # Free the LLM as soon as generation ends; release() is idempotent
+                slot.release()
+            store_answer(scope, req.question, embedding, {
+                "answer_with_refs": "".join(tokens).strip(),
+                "citations": citations,
+                "timings": timings,
+                "context": usage
+            })
+            yield sse_event("done", {"timings": timings, "context": usage})
+        finally:
+            if slot is not None:
+                slot.release()
+
+    return events()
+
+
+# --- ✅ Batch Query Endpoint ---
+@router.post("/query/batch")
+async def ask_questions_batch(req: BatchQueryRequest):
+    """
+    Answer many questions with one embedding call and one vector search call.
+    Generations run BATCH_LLM_CONCURRENCY at a time, and each result is streamed
+    back as an NDJSON line as soon as it finishes (so lines arrive out of order;
+    use "index" to match them up).
+    """
+    if not req.questions or any(not q.strip() for q in req.questions):
+        raise HTTPException(status_code=400, detail="Every question must be non-empty.")
+
+    # Cached answers are looked up first, so only the misses pay for retrieval
+    try:
+        scope, embeddings, hits = await lookup_cached_answers(req.questions, req.documents, req.mode)
+        misses = [i for i, hit in enumerate(hits) if not hit]
+        all_matches = [None] * len(req.questions)
+        if misses:
+            found = await retrieve_batch(
+                [req.questions[i] for i in misses], req.documents, req.mode,
+                embeddings=[embeddings[i] for i in misses] if embeddings else None
+            )
+            for i, matches in zip(misses, found):
+                all_matches[i] = matches
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Retrieval failed: {e}")
+
+    semaphore = asyncio.Semaphore(max(1, config.BATCH_LLM_CONCURRENCY))
+
+    async def answer(index: int, question: str, matches):
+        if hits[index]:
+            return {"index": index, "question": question, **cached_response(hits[index])}
+        async with semaphore:
+            try:
+                result = await generate_answer(question, matches, priority=BATCH)
+                store_answer(scope, question, embeddings[index] if embeddings else None, result)
+            except HTTPException as e:
+                result = {"error": e.detail, "status": e.status_code}
+            except Exception as e:
+                # One failed question must not take down the rest of the stream
+                result = {"error": f"Answer failed: {e}", "status": 500}
+        return {"index": index, "question": question, **result}
+
+    async def stream_results():
+        tasks = [
+            asyncio.create_task(answer(i, q, m))
+            for i, (q, m) in enumerate(zip(req.questions, all_matches))
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: stop pending generations
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
@@ -0,0 +1,146 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    computation and every caller that arrives while it is running awaits the
+    same result (or the same exception). Nothing is cached once it finishes.
+
+    The computation runs in its own task, so a caller that is cancelled (e.g.
+    its client disconnected) only stops waiting; the others still get the result.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.joined = 0
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable]):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.joined += 1
+        else:
+            self.leaders += 1
+            task = asyncio.create_task(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every waiter has gone
+
+    def stats(self) -> Dict:
+        return {"leaders": self.leaders, "joined": self.joined, "in_flight": len(self._inflight)}
+
+
+class Broadcast:
+    """Replayable event log: subscribers get every event from the start, then follow live."""
+
+    def __init__(self):
+        self.events: List = []
+        self.done = False
+        self.subscribers = 0
+        self.pump: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event):
+        self.events.append(event)
+        self._wake()
+
+    def close(self):
+        self.done = True
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator:
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class StreamFanout:
+    """
+    Single-flight for streaming responses. The first request for a key starts
+    the stream; it runs in its own task and its events are broadcast, so
+    identical requests arriving before it ends replay what was already sent
+    and then receive the rest live. Once every subscriber has disconnected
+    the stream is cancelled, so an abandoned generation does not keep its
+    LLM slot; requests arriving after that start a new stream.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.joined = 0
+        self.abandoned = 0
+        self._starting = SingleFlight()
+        self._running: Dict[Hashable, Broadcast] = {}
+        self._tasks = set()
+
+    async def subscribe(self, key: Hashable, start: Callable[[], Awaitable[AsyncIterator]]) -> AsyncIterator:
+        """
+        Return an iterator over the stream for `key`. `start` runs the stream's
+        setup (which may raise, e.g. HTTPException) and returns its event generator.
+        """
+        broadcast = self._running.get(key)
+        if broadcast is None:
+            broadcast = await self._starting.do(key, lambda: self._start(key, start))
+        else:
+            self.joined += 1
+        # Counted when handed out, not when iteration starts, so a joiner that
+        # has not read anything yet keeps the stream alive
+        broadcast.subscribers += 1
+        return self._follow(key, broadcast)
+
+    async def _follow(self, key: Hashable, broadcast: Broadcast) -> AsyncIterator:
+        try:
+            async for event in broadcast.subscribe():
+                yield event
+        finally:
+            broadcast.subscribers -= 1
+            if not broadcast.subscribers and not broadcast.done:
+                # Nobody is listening: stop generating and let the stream release its resources
+                self.abandoned += 1
+                if self._running.get(key) is broadcast:
+                    del self._running[key]
+                broadcast.pump.cancel()
+
+    async def _start(self, key: Hashable, start: Callable[[], Awaitable[AsyncIterator]]) -> Broadcast:
+        events = await start()
+        broadcast = Broadcast()
+        self._running[key] = broadcast
+        self.started += 1
+        task = asyncio.create_task(self._pump(key, events, broadcast))
+        broadcast.pump = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return broadcast
+
+    async def _pump(self, key: Hashable, events: AsyncIterator, broadcast: Broadcast):
+        try:
+            async for event in events:
+                broadcast.publish(event)
+        finally:
+            if self._running.get(key) is broadcast:
+                del self._running[key]
+            broadcast.close()
+
+    def stats(self) -> Dict:
+        return {
+            "streams_started": self.started,
+            "streams_joined": self.joined + self._starting.joined,
+            "streams_abandoned": self.abandoned,
+            "streaming": len(self._running),
+        }
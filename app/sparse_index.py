@@ -0,0 +1,197 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+from app.config import Config
+from app.local_vectorstore import LocalHit
+
+config = Config()
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Case-folded word tokens; \\w keeps accented letters, digits and underscores together."""
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 scoring over chunk texts, kept next to the dense
+    vectors so exact terms (error codes, CSV column names, vocabulary words)
+    can be matched even when the embedding misses them.
+
+    Postings live in SQLite, so each upsert or delete touches only the rows
+    of the chunks involved and every worker sees the same index. Only term
+    counts are stored, not the chunk text: hits carry the point ID, source
+    and version, and the full payload is read from the vector store.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 1.0):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS bm25_docs (
+                   doc INTEGER PRIMARY KEY,
+                   point_id TEXT NOT NULL UNIQUE,
+                   source TEXT,
+                   doc_version TEXT,
+                   length INTEGER NOT NULL
+               );
+               CREATE INDEX IF NOT EXISTS bm25_docs_source ON bm25_docs (source, doc_version);
+               CREATE TABLE IF NOT EXISTS bm25_postings (
+                   term TEXT NOT NULL,
+                   doc INTEGER NOT NULL,
+                   tf INTEGER NOT NULL,
+                   PRIMARY KEY (term, doc)
+               ) WITHOUT ROWID;
+               CREATE INDEX IF NOT EXISTS bm25_postings_doc ON bm25_postings (doc);
+               CREATE TABLE IF NOT EXISTS bm25_stats (
+                   id INTEGER PRIMARY KEY CHECK (id = 0),
+                   docs INTEGER NOT NULL,
+                   total_len INTEGER NOT NULL
+               );
+               INSERT OR IGNORE INTO bm25_stats (id, docs, total_len) VALUES (0, 0, 0);
+               -- Every delete path goes through bm25_docs; postings and stats follow
+               CREATE TRIGGER IF NOT EXISTS bm25_docs_insert AFTER INSERT ON bm25_docs BEGIN
+                   UPDATE bm25_stats SET docs = docs + 1, total_len = total_len + NEW.length WHERE id = 0;
+               END;
+               CREATE TRIGGER IF NOT EXISTS bm25_docs_delete AFTER DELETE ON bm25_docs BEGIN
+                   DELETE FROM bm25_postings WHERE doc = OLD.doc;
+                   UPDATE bm25_stats SET docs = docs - 1, total_len = total_len - OLD.length WHERE id = 0;
+               END;"""
+        )
+
+    def _write(self, statements):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = sum(self._conn.execute(sql, params).rowcount for sql, params in statements)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    # --- Writes ---
+    def add(self, ids: List[str], payloads: List[Dict]):
+        """Index payloads by point ID; each payload's 'text' is what gets tokenized."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for point_id, payload in zip(ids, payloads):
+                    tf = Counter(tokenize(payload.get("text", "")))
+                    self._conn.execute("DELETE FROM bm25_docs WHERE point_id = ?", (str(point_id),))
+                    doc = self._conn.execute(
+                        "INSERT INTO bm25_docs (point_id, source, doc_version, length) VALUES (?, ?, ?, ?)",
+                        (str(point_id), payload.get("source"), payload.get("doc_version"), sum(tf.values()))
+                    ).lastrowid
+                    self._conn.executemany(
+                        "INSERT INTO bm25_postings (term, doc, tf) VALUES (?, ?, ?)",
+                        [(term, doc, count) for term, count in tf.items()]
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def remove_sources(self, sources: List[str]) -> int:
+        return self._write([
+            (f"DELETE FROM bm25_docs WHERE source IN ({','.join('?' * len(sources))})", list(sources))
+        ]) if sources else 0
+
+    def remove_stale_versions(self, source: str, version: str) -> int:
+        return self._write([(
+            "DELETE FROM bm25_docs WHERE source = ? AND (doc_version IS NULL OR doc_version != ?)",
+            (source, version)
+        )])
+
+    def reset(self):
+        self._write([("DELETE FROM bm25_docs", ())])
+
+    # --- Search ---
+    def search(self, query: str, k: int = 5, sources: List[str] = None) -> List[LocalHit]:
+        """
+        Top-k chunks by BM25. Hit payloads hold only 'source' and 'doc_version';
+        the caller fetches the full payloads of the hits it keeps.
+
+        Terms found in more than max_df_ratio of the chunks ("the", "what") add
+        little to the ranking but have the longest postings, so they are left
+        out unless nothing rarer is asked for. Scoring and the top-k cut run in
+        SQLite, so only k rows come back.
+        """
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_docs, total_len = self._conn.execute("SELECT docs, total_len FROM bm25_stats WHERE id = 0").fetchone()
+            if not n_docs:
+                return []
+            df = dict(self._conn.execute(
+                f"SELECT term, COUNT(*) FROM bm25_postings WHERE term IN ({','.join('?' * len(terms))}) GROUP BY term",
+                terms
+            ).fetchall())
+            if not df:
+                return []
+            kept = [t for t in df if df[t] / n_docs <= self.max_df_ratio] or [min(df, key=df.get)]
+
+            idf = [(t, math.log(1 + (n_docs - df[t] + 0.5) / (df[t] + 0.5))) for t in kept]
+            sql = (f"WITH q(term, idf) AS (VALUES {','.join(['(?, ?)'] * len(idf))}) "
+                   "SELECT d.point_id, d.source, d.doc_version, "
+                   "SUM(q.idf * p.tf * ? / (p.tf + ? * (1 - ? + ? * d.length / ?))) AS score "
+                   "FROM q JOIN bm25_postings p ON p.term = q.term JOIN bm25_docs d ON d.doc = p.doc")
+            params = [value for pair in idf for value in pair]
+            params += [self.k1 + 1, self.k1, self.b, self.b, total_len / n_docs]
+            if sources:
+                sql += f" WHERE d.source IN ({','.join('?' * len(sources))})"
+                params += list(sources)
+            sql += " GROUP BY p.doc ORDER BY score DESC LIMIT ?"
+            params.append(k)
+            rows = self._conn.execute(sql, params).fetchall()
+
+        return [
+            LocalHit(id=point_id, score=score, payload={"source": source, "doc_version": version})
+            for point_id, source, version, score in rows
+        ]
+
+
+def reciprocal_rank_fusion(result_lists: List[List], k: int, rrf_k: int = 60, per_source_k: int = None) -> List[LocalHit]:
+    """
+    Fuse ranked result lists (anything with .id and .payload) by reciprocal rank:
+    score(d) = sum over lists of 1 / (rrf_k + rank of d). A hit that appears in
+    several lists keeps the fullest payload it was returned with. With
+    `per_source_k`, at most that many fused hits are kept per source.
+    """
+    fused: Dict[str, float] = defaultdict(float)
+    payloads: Dict[str, Dict] = {}
+    for results in result_lists:
+        for rank, hit in enumerate(results, 1):
+            point_id = str(hit.id)
+            fused[point_id] += 1.0 / (rrf_k + rank)
+            if "text" not in payloads.get(point_id, {}):
+                payloads[point_id] = hit.payload or {}
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    if per_source_k:
+        per_source = Counter()
+        top = []
+        for pid, score in ranked:
+            source = payloads[pid].get("source")
+            if per_source[source] < per_source_k:
+                per_source[source] += 1
+                top.append((pid, score))
+    else:
+        top = ranked
+    return [LocalHit(id=pid, score=score, payload=payloads[pid]) for pid, score in top[:k]]
+
+
+sparse_index = BM25Index(config.SPARSE_INDEX_PATH, max_df_ratio=config.BM25_MAX_DF_RATIO) if config.SPARSE_INDEX_ENABLED else None
@@ -1,7 +1,8 @@
 import streamlit as st
 from minio import Minio
 import requests
-import io, os
+import io, os, time
+import json
 import textwrap
 from dotenv import load_dotenv
 
@@ -51,6 +52,43 @@ def fetch_document_list():
         return files
     return None
 
+def iter_sse(response):
+    """Yield (event, data) pairs from a text/event-stream response."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+STAGE_PROGRESS = {
+    "queued": 0.0, "downloading": 0.1, "extracting": 0.3,
+    "streaming": 0.5,  # large files: extract, embed and upsert overlap
+    "embedding": 0.6, "upserting": 0.9, "done": 1.0
+}
+
+def wait_for_job(job_id, object_name, poll_interval=1.0):
+    """Poll an ingestion job until it finishes, showing its stage and counters."""
+    bar = st.progress(0.0, text=f"⏳ `{object_name}`: queued")
+    while True:
+        res = safe_api_call(requests.get, f"{API_BASE_URL}/jobs/{job_id}")
+        if not res:
+            bar.empty()
+            return None
+        job = res.json()
+        counters = ", ".join(f"{k.replace('_', ' ')}: {v}" for k, v in job["progress"].items() if v is not None)
+        bar.progress(STAGE_PROGRESS.get(job["stage"], 0.0), text=f"⏳ `{object_name}`: {job['stage']} {counters}")
+        if job["status"] in ("succeeded", "failed"):
+            bar.empty()
+            return job
+        time.sleep(poll_interval)
+
 def upload_and_embed_to_minio(uploaded_file):
     object_name = uploaded_file.name
     if object_name in st.session_state.uploaded_files:
@@ -76,12 +114,17 @@ def upload_and_embed_to_minio(uploaded_file):
         "object_name": object_name
     })
 
-    if res:
-        st.success(res.json().get("message", "✅ File embedded successfully"))
+    if not res:
+        st.error("❌ Failed to embed file.")
+        return
+
+    job = wait_for_job(res.json()["job_id"], object_name)
+    if job and job["status"] == "succeeded":
+        st.success(job.get("message") or "✅ File embedded successfully")
         st.session_state.uploaded_files.add(object_name)
         st.cache_data.clear()
-    else:
-        st.error("❌ Failed to embed file.")
+    elif job:
+        st.error(f"❌ Failed to embed `{object_name}` during {job['stage']}: {job.get('error')}")
 
 def format_reference_text(text, max_width=100):
     wrapped = textwrap.fill(text, width=max_width)
@@ -249,18 +292,29 @@ with tab3:
             try:
                 response = safe_api_call(
                     requests.post,
-                    f"{API_BASE_URL}/query",
+                    f"{API_BASE_URL}/query/stream",
                     json={
                         "question": question,
                         "documents": list(st.session_state.selected_docs)
-                    }
+                    },
+                    stream=True
                 )
                 if response:
-                    result = response.json()
                     st.markdown("### 🧠 Answer")
-                    st.write(result.get("answer_with_refs", "No answer returned."))
+                    answer_box = st.empty()
+                    answer, citations, failed = "", [], None
+                    for event, data in iter_sse(response):
+                        if event == "citations":
+                            citations = data
+                        elif event == "token":
+                            answer += data.get("token", "")
+                            answer_box.markdown(answer + "▌")
+                        elif event == "error":
+                            failed = data.get("detail", "Unknown error")
+                    answer_box.markdown(answer or "No answer returned.")
+                    if failed:
+                        st.error(f"❌ {failed}")
 
-                    citations = result.get("citations", [])
                     if citations:
                         # Only show references from selected docs!
                         valid_sources = set(os.path.basename(f) for f in st.session_state.selected_docs)
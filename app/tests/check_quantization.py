@@ -0,0 +1,105 @@
+import sys
+import numpy as np
+from qdrant_client import QdrantClient
+from app.config import Config
+from app.embedders import matryoshka_truncate
+
+# Recall-vs-memory report for the vector storage modes in Config.
+# Samples stored vectors from the collection, uses some of them as queries and
+# compares the top-k of each storage mode against exact float32 search.
+# Truncated dimensions are only meaningful if the collection holds full-size
+# Matryoshka embeddings (e.g. nomic-embed-text-v1.5 at VECTOR_SIZE=768); they are
+# shortened with matryoshka_truncate, the same way the service does it.
+
+config = Config()
+client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
+
+SAMPLE_SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+NUM_QUERIES = 200
+TOP_K = 10
+DIMS = (768, 512, 256)
+MODES = ("none", "scalar", "binary")
+
+
+def load_sample(limit: int) -> np.ndarray:
+    vectors, offset = [], None
+    while len(vectors) < limit:
+        points, offset = client.scroll(
+            collection_name=config.COLLECTION_NAME,
+            limit=min(1000, limit - len(vectors)),
+            offset=offset,
+            with_payload=False,
+            with_vectors=True
+        )
+        vectors.extend(p.vector for p in points)
+        if offset is None:
+            break
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms == 0, 1, norms)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1)
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def quantized_scores(data: np.ndarray, queries: np.ndarray, mode: str) -> np.ndarray:
+    if mode == "scalar":
+        # INT8 over the 0.99 quantile range, like Qdrant's scalar quantization
+        lo, hi = np.quantile(data, [0.005, 0.995])
+        scale = (hi - lo) / 255
+        codes = np.round((np.clip(data, lo, hi) - lo) / scale)
+        return queries @ (codes * scale + lo).T
+    if mode == "binary":
+        return np.sign(queries) @ np.sign(data).T
+    return queries @ data.T
+
+
+def recall(data: np.ndarray, queries: np.ndarray, truth: np.ndarray, mode: str, rescore: bool) -> float:
+    scores = quantized_scores(data, queries, mode)
+    if mode != "none" and rescore:
+        # Oversample candidates with quantized scores, then rescore with the originals
+        candidates = top_k(scores, int(TOP_K * config.QUANTIZATION_OVERSAMPLING))
+        exact = np.einsum("qd,qkd->qk", queries, data[candidates])
+        found = np.take_along_axis(candidates, top_k(exact, TOP_K), axis=1)
+    else:
+        found = top_k(scores, TOP_K)
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def bytes_per_vector(dim: int, mode: str) -> float:
+    return {"none": dim * 4, "scalar": dim, "binary": dim / 8}[mode]
+
+
+if __name__ == "__main__":
+    data = normalize(load_sample(SAMPLE_SIZE))
+    if len(data) <= TOP_K:
+        print(f"❌ Need more than {TOP_K} vectors in '{config.COLLECTION_NAME}', found {len(data)}.")
+        sys.exit(1)
+
+    rng = np.random.default_rng(0)
+    queries = data[rng.choice(len(data), size=min(NUM_QUERIES, len(data)), replace=False)]
+    truth = top_k(queries @ data.T, TOP_K)
+    print(f"[📏] {len(data)} vectors, {len(queries)} queries, recall@{TOP_K} vs. exact float32 {data.shape[1]}-d\n")
+
+    print(f"{'dim':>5} {'quantization':>12} {'rescore':>8} {'recall':>8} {'RAM/vector':>12} {'RAM/1M vectors':>15}")
+    for dim in DIMS:
+        if dim > data.shape[1]:
+            continue
+        if dim == data.shape[1]:
+            d_data, d_queries = data, queries
+        else:
+            d_data, d_queries = matryoshka_truncate(data, dim), matryoshka_truncate(queries, dim)
+        for mode in MODES:
+            for rescore in ((False,) if mode == "none" else (False, True)):
+                r = recall(d_data, d_queries, truth, mode, rescore)
+                ram = bytes_per_vector(dim, mode)
+                print(f"{dim:>5} {mode:>12} {str(rescore):>8} {r:>8.3f} {ram:>10.0f} B {ram * 1e6 / 2**20:>12.0f} MB")
+    print("\nWith VECTOR_ON_DISK=True, quantized modes keep only the quantized copy in RAM; originals stay on disk for rescoring.")
@@ -0,0 +1,22 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("dotenv")
+pytest.importorskip("fitz")
+pytest.importorskip("pdfplumber")
+pytest.importorskip("llama_index.core")
+
+
+def test_bulk_ingest_imports_without_the_vector_store():
+    # Spawned pool workers re-import the CLI module; it must not connect to Qdrant or open caches
+    code = (
+        "import sys, app.ingestion.bulk_ingest\n"
+        "loaded = [m for m in ('app.vectorstore', 'app.answer_cache', 'app.ingestion.ingestion_pipeline')"
+        " if m in sys.modules]\n"
+        "assert not loaded, loaded\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).resolve().parents[2])
@@ -0,0 +1,45 @@
+import logging
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("chardet")
+pytest.importorskip("llama_index.core")
+
+from app.extraction.csv import ExtractCSV
+
+
+def extract_both(path):
+    return ExtractCSV.extract_and_chunk(path), list(ExtractCSV.iter_chunks(path))
+
+
+def test_unreadable_csv_is_logged_and_skipped_by_both_paths(tmp_path, caplog):
+    # Single-column tables: csv.Sniffer cannot determine a delimiter
+    path = tmp_path / "single_column.csv"
+    path.write_text("id\n1\n2\n\nname\nx\ny\n")
+
+    with caplog.at_level(logging.ERROR):
+        whole, streamed = extract_both(str(path))
+
+    assert whole == [] and streamed == []
+    assert sum("Error reading CSV file" in r.message for r in caplog.records) == 2
+
+
+def test_failing_table_is_skipped_by_both_paths(tmp_path, monkeypatch, caplog):
+    path = tmp_path / "two_tables.csv"
+    path.write_text("a,b\n1,2\n3,4\n\nc,d\n5,6\n7,8\n")
+    table_nodes = ExtractCSV._table_nodes
+
+    def fail_first_table(splitter, source, ext, csv_df, table_id, start=0):
+        if table_id == 0:
+            raise ValueError("broken table")
+        return table_nodes(splitter, source, ext, csv_df, table_id, start)
+
+    monkeypatch.setattr(ExtractCSV, "_table_nodes", staticmethod(fail_first_table))
+    with caplog.at_level(logging.ERROR):
+        whole, streamed = extract_both(str(path))
+
+    for nodes in (whole, streamed):
+        assert nodes
+        assert {n.metadata["table_id"] for n in nodes} == {"table_1"}
+    assert sum("Failed processing table 0" in r.message for r in caplog.records) == 2
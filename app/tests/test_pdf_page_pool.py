@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("pdfplumber")
+pytest.importorskip("llama_index.core")
+
+from app.extraction import pdf
+from app.ingestion.extract import shutdown_extraction, submit_extraction
+
+
+class NoExtractionPool:
+    """Stands in for main.extraction_pool; PDFs must not be sent to it."""
+
+    def submit(self, *args, **kwargs):
+        raise AssertionError("PDF was sent to the extraction process pool")
+
+
+class RecordingExtractionPool:
+    """Stands in for main.extraction_pool and records what was sent to it."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+        return ThreadPoolExecutor(max_workers=1).submit(fn, *args)
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for i in range(1, pages + 1):
+        doc.new_page().insert_text((72, 72), f"Page {i} of the page pool test")
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+@pytest.fixture
+def large_pdf(tmp_path):
+    return make_pdf(tmp_path / "large.pdf", 200)
+
+
+def test_large_pdf_is_scanned_on_several_page_workers(large_pdf, monkeypatch):
+    monkeypatch.setattr(pdf.config, "PDF_PAGE_WORKERS", 4)
+    monkeypatch.setattr(pdf.config, "PDF_PARALLEL_MIN_PAGES", 20)
+    shutdown_extraction()
+    try:
+        # Same call as main._ingest_object and bulk_ingest
+        nodes = submit_extraction(NoExtractionPool(), large_pdf).result(timeout=300)
+
+        assert pdf._page_pool is not None
+        assert len(pdf._page_pool._processes) > 1
+        text = "\n".join(node.text for node in nodes)
+        assert "Page 1 of" in text and "Page 200 of" in text
+    finally:
+        shutdown_extraction()
+
+
+def test_short_pdf_goes_to_the_extraction_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf.config, "PDF_PAGE_WORKERS", 4)
+    monkeypatch.setattr(pdf.config, "PDF_PARALLEL_MIN_PAGES", 20)
+    short_pdf = make_pdf(tmp_path / "short.pdf", 30)
+    shutdown_extraction()
+    try:
+        pool = RecordingExtractionPool()
+        nodes = submit_extraction(pool, short_pdf).result(timeout=300)
+
+        assert pool.submitted == [(short_pdf, None)]
+        assert pdf._page_pool is None
+        assert "Page 30 of" in "\n".join(node.text for node in nodes)
+    finally:
+        shutdown_extraction()
+
+
+def test_in_memory_pdf_reaches_page_workers_as_a_path(large_pdf, monkeypatch):
+    monkeypatch.setattr(pdf.config, "PDF_PAGE_WORKERS", 4)
+    monkeypatch.setattr(pdf.config, "PDF_PARALLEL_MIN_PAGES", 20)
+    with open(large_pdf, "rb") as f:
+        data = f.read()
+    sources = []
+    scan_page_range = pdf.scan_page_range
+
+    class SpyPool:
+        def submit(self, fn, source, start, end):
+            sources.append(source)
+            return ThreadPoolExecutor(max_workers=1).submit(scan_page_range, source, start, end)
+
+    monkeypatch.setattr(pdf, "_get_page_pool", SpyPool)
+    scans = list(pdf.iter_page_scans_parallel(data, 200, 4))
+
+    assert [scan["page_num"] for scan in scans] == list(range(1, 201))
+    assert sources and all(isinstance(source, str) for source in sources)
+    assert not any(pdf.os.path.exists(source) for source in set(sources))
@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("pdfplumber")
+pytest.importorskip("llama_index.core")
+
+from app.extraction.pdf import ExtractPDF
+
+
+@pytest.mark.parametrize("name", ["corrupt.pdf", "slides.pptx"])
+def test_unreadable_file_yields_nothing_on_both_paths(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"this is not a PDF document\n" * 100)
+
+    assert ExtractPDF.extract_and_chunk(str(path)) == []
+    assert list(ExtractPDF.iter_chunks(str(path))) == []
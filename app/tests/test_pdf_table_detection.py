@@ -0,0 +1,40 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("pdfplumber")
+pytest.importorskip("llama_index.core")
+
+from app.extraction import pdf
+
+
+@pytest.fixture
+def page():
+    doc = fitz.open()
+    yield doc.new_page()
+    doc.close()
+
+
+def test_single_bordered_box_is_not_a_table(page, monkeypatch):
+    monkeypatch.setattr(pdf.config, "PDF_TABLE_DETECTION", "rulings")
+    page.draw_rect(fitz.Rect(50, 50, 550, 750), color=(0, 0, 0))
+
+    assert pdf.count_rulings(page) == (2, 2)
+    assert not pdf.likely_has_table(page)
+
+
+def test_filled_background_is_ignored(page, monkeypatch):
+    monkeypatch.setattr(pdf.config, "PDF_TABLE_DETECTION", "rulings")
+    page.draw_rect(fitz.Rect(50, 50, 300, 200), color=None, fill=(0.9, 0.9, 0.9))
+    page.draw_rect(fitz.Rect(50, 250, 300, 400), color=None, fill=(0.9, 0.9, 0.9))
+
+    assert pdf.count_rulings(page) == (0, 0)
+    assert not pdf.likely_has_table(page)
+
+
+def test_two_cell_grid_is_flagged(page, monkeypatch):
+    monkeypatch.setattr(pdf.config, "PDF_TABLE_DETECTION", "rulings")
+    page.draw_rect(fitz.Rect(50, 50, 300, 100), color=(0, 0, 0))
+    page.draw_rect(fitz.Rect(50, 100, 300, 150), color=(0, 0, 0))
+
+    assert pdf.count_rulings(page) == (3, 2)
+    assert pdf.likely_has_table(page)
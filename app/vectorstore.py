@@ -1,41 +1,211 @@
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
 from app.config import Config
+from app.local_vectorstore import LocalVectorIndex
+from app.sparse_index import sparse_index
+from app.answer_cache import document_versions
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
 import uuid
+from typing import Dict, List
 
 config = Config()
 COLLECTION_NAME = config.COLLECTION_NAME
+# Namespace for deterministic point IDs; changing it orphans every existing point
+POINT_ID_NAMESPACE = uuid.UUID("5b0f7c1e-8d2a-4c39-9a51-3f6e2d7b8c40")
 
-# --- ✅ Initialize Qdrant connection ---
-try:
-    client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
-    client.get_collections()
-except Exception as e:
-    raise RuntimeError(f"❌ Failed to connect to Qdrant at {config.QDRANT_HOST}:{config.QDRANT_PORT} → {e}")
+# --- ✅ Initialize Qdrant connection (gRPC when available, REST otherwise) ---
+def _connect():
+    """Return (client, uses_grpc)."""
+    if config.VECTOR_BACKEND == "qdrant_embedded":
+        # Qdrant's embedded mode runs in-process on local files, no server needed
+        print(f"[Qdrant] Using embedded storage at '{config.QDRANT_PATH}'")
+        return QdrantClient(path=config.QDRANT_PATH), False
+    if config.QDRANT_PREFER_GRPC:
+        try:
+            grpc_client = QdrantClient(
+                host=config.QDRANT_HOST,
+                port=config.QDRANT_PORT,
+                grpc_port=config.QDRANT_GRPC_PORT,
+                prefer_grpc=True
+            )
+            grpc_client.get_collections()
+            print(f"[Qdrant] Connected over gRPC at {config.QDRANT_HOST}:{config.QDRANT_GRPC_PORT}")
+            return grpc_client, True
+        except Exception as e:
+            print(f"[Qdrant] gRPC unavailable ({e}), falling back to REST")
+    rest_client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
+    rest_client.get_collections()
+    return rest_client, False
+
+# With VECTOR_BACKEND="numpy" every operation below is served by the in-process index instead
+client = None
+async_client = None  # used by the async API path; None means "run the sync call in a thread"
+local_index = None
+if config.VECTOR_BACKEND == "numpy":
+    local_index = LocalVectorIndex(
+        path=config.LOCAL_INDEX_PATH,
+        dim=config.VECTOR_SIZE,
+        dtype=config.LOCAL_INDEX_DTYPE,
+        hnsw_threshold=config.LOCAL_INDEX_HNSW_THRESHOLD
+    )
+else:
+    try:
+        client, uses_grpc = _connect()
+    except Exception as e:
+        raise RuntimeError(f"❌ Failed to connect to Qdrant at {config.QDRANT_HOST}:{config.QDRANT_PORT} → {e}")
+    # Embedded storage is locked by the sync client, so only a server gets an async client
+    if config.VECTOR_BACKEND == "qdrant":
+        async_client = AsyncQdrantClient(
+            host=config.QDRANT_HOST,
+            port=config.QDRANT_PORT,
+            grpc_port=config.QDRANT_GRPC_PORT,
+            prefer_grpc=uses_grpc
+        )
+
+# --- ✅ Cached collection state ---
+# Filled at startup, kept current by create/delete/reset and refreshed lazily when
+# a lookup misses or Qdrant reports a missing collection, so hot paths skip
+# get_collections() while the collection exists.
+_collections = set()
+_collections_lock = threading.Lock()
+
+def _refresh_collections():
+    names = {c.name for c in client.get_collections().collections}
+    with _collections_lock:
+        _collections.clear()
+        _collections.update(names)
+    print(f"[Qdrant] Existing collections: {sorted(names)}")
+
+def _collection_exists(name: str = COLLECTION_NAME) -> bool:
+    with _collections_lock:
+        return name in _collections
+
+def _confirm_collection(name: str = COLLECTION_NAME) -> bool:
+    """
+    Like _collection_exists(), but a miss is re-checked against Qdrant once:
+    the collection may have been created by another worker or process.
+    """
+    if _collection_exists(name):
+        return True
+    _refresh_collections()
+    return _collection_exists(name)
+
+def _is_not_found(e: Exception) -> bool:
+    if getattr(e, "status_code", None) == 404:
+        return True
+    code = getattr(e, "code", None)  # grpc.RpcError
+    if callable(code) and getattr(code(), "name", "") == "NOT_FOUND":
+        return True
+    message = str(e).lower()
+    return "collection" in message and ("not found" in message or "doesn't exist" in message)
+
+if client is not None:
+    _refresh_collections()
+
+# --- ✅ Payload indexes used by document-scoped filters ---
+PAYLOAD_INDEXES = {
+    "source": models.PayloadSchemaType.KEYWORD,
+    "file_format": models.PayloadSchemaType.KEYWORD,
+    "page_num": models.PayloadSchemaType.INTEGER,
+    "content_type": models.PayloadSchemaType.KEYWORD,
+}
+_indexes_ready = False
+
+def _ensure_payload_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    schema = client.get_collection(collection_name=COLLECTION_NAME).payload_schema or {}
+    for field, field_type in PAYLOAD_INDEXES.items():
+        if field not in schema:
+            print(f"[Qdrant] Creating payload index: {field} ({field_type.value})")
+            client.create_payload_index(
+                collection_name=COLLECTION_NAME,
+                field_name=field,
+                field_schema=field_type,
+                wait=True
+            )
+    _indexes_ready = True
+
+# --- ✅ Storage mode (quantization) from config ---
+def _quantization_config():
+    mode = config.VECTOR_QUANTIZATION.lower()
+    if mode == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True
+            )
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    if mode != "none":
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION: {config.VECTOR_QUANTIZATION}")
+    return None
+
+def _search_params():
+    if config.VECTOR_QUANTIZATION.lower() == "none":
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(
+            rescore=config.QUANTIZATION_RESCORE,
+            oversampling=config.QUANTIZATION_OVERSAMPLING
+        )
+    )
 
 # --- ✅ Ensure collection exists ---
 def ensure_collection():
-    existing = [c.name for c in client.get_collections().collections]
-    print(f"[Qdrant] Existing collections: {existing}")
-    if COLLECTION_NAME not in existing:
-        print(f"[Qdrant] Creating collection: {COLLECTION_NAME}")
+    if local_index is not None:
+        return
+    if _collection_exists():
+        _ensure_payload_indexes()
+        return
+    _refresh_collections()
+    if not _collection_exists():
+        print(f"[Qdrant] Creating collection: {COLLECTION_NAME} "
+              f"(dim={config.VECTOR_SIZE}, quantization={config.VECTOR_QUANTIZATION}, on_disk={config.VECTOR_ON_DISK})")
         client.create_collection(
             collection_name=COLLECTION_NAME,
             vectors_config=models.VectorParams(
-                size=768,
-                distance=models.Distance.COSINE
-            )
+                size=config.VECTOR_SIZE,
+                distance=models.Distance.COSINE,
+                on_disk=config.VECTOR_ON_DISK
+            ),
+            quantization_config=_quantization_config()
         )
+        with _collections_lock:
+            _collections.add(COLLECTION_NAME)
+    _ensure_payload_indexes()
+
+# --- ✅ Deterministic point IDs ---
+def point_id(source: str, version, chunk_key) -> str:
+    """
+    Derive a stable point ID from (source, version, chunk key), so re-ingesting
+    the same document version overwrites its points instead of duplicating them.
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}|{version}|{chunk_key}"))
 
 # --- ✅ Upsert document chunks into Qdrant ---
 def upsert_vectors(vectors):
+    """
+    Write vectors in UPSERT_BATCH_SIZE batches, keeping up to UPSERT_PARALLEL
+    unacknowledged (wait=False) batches in flight. The final batch is sent
+    with wait=True once the others are accepted; Qdrant applies operations in
+    order, so its acknowledgement covers the whole write.
+    """
     ensure_collection()
     points = []
     for v in vectors:
-        print(f"🔍 Upserting vector → text: {v['text'][:50]}..., emb_len: {len(v['embedding'])}, meta: {v['metadata']}")
+        meta = v["metadata"]
         points.append(
             models.PointStruct(
-                id=str(uuid.uuid4()),
+                id=point_id(meta["source"], meta.get("doc_version"), meta.get("chunk_index", meta.get("key"))),
                 vector=v["embedding"],
                 payload={
                     "text": v["text"],
@@ -45,37 +215,211 @@ def upsert_vectors(vectors):
         )
     if not points:
         print("⚠️ No vectors to upsert.")
-    else:
-        print(f"🚀 Upserting {len(points)} vectors to Qdrant.")
-        client.upsert(collection_name=COLLECTION_NAME, points=points)
+        return
+
+    # BM25 side index for keyword / hybrid retrieval, keyed by the same point IDs
+    if sparse_index is not None:
+        sparse_index.add([p.id for p in points], [p.payload for p in points])
+
+    if local_index is not None:
+        local_index.upsert([p.id for p in points], [p.vector for p in points], [p.payload for p in points])
+        print(f"[LocalIndex] Upserted {len(points)} points ({local_index.count()} total)")
+        return
+
+    size = max(1, config.UPSERT_BATCH_SIZE)
+    batches = [points[i:i + size] for i in range(0, len(points), size)]
+    *pending, last = batches
+    print(f"🚀 Upserting {len(points)} vectors to Qdrant in {len(batches)} batch(es).")
+
+    start = time.perf_counter()
+    try:
+        _write_batches(pending, last)
+    except Exception as e:
+        if not _is_not_found(e):
+            raise
+        # Collection vanished behind the cache's back: recreate it and retry once
+        print(f"[Qdrant] Collection missing during upsert ({e}), recreating")
+        _refresh_collections()
+        ensure_collection()
+        _write_batches(pending, last)
+    elapsed = time.perf_counter() - start
+
+    rate = len(points) / elapsed if elapsed > 0 else float("inf")
+    print(f"[Qdrant] Upserted {len(points)} points in {elapsed:.2f}s ({rate:.1f} points/sec)")
+
+def _write_batches(pending, last):
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, config.UPSERT_PARALLEL)) as pool:
+            list(pool.map(
+                lambda batch: client.upsert(collection_name=COLLECTION_NAME, points=batch, wait=False),
+                pending
+            ))
+    client.upsert(collection_name=COLLECTION_NAME, points=last, wait=True)
 
 # --- ✅ Search with optional filtering by document source ---
-def search_similar(query_embedding, k=5, filter_docs=None):
-    if COLLECTION_NAME not in [c.name for c in client.get_collections().collections]:
-        raise RuntimeError(f"[Qdrant] Collection '{COLLECTION_NAME}' does not exist. Cannot perform search.")
+def search_similar(query_embedding, k=5, filter_docs=None, per_doc_k=None):
+    """
+    Search the collection, restricted to `filter_docs` sources when given.
+    With `per_doc_k`, up to that many hits are returned from each selected
+    document (one grouped query) instead of a single global top-k.
+    """
+    if local_index is not None:
+        results = local_index.search(query_embedding, k=k, sources=filter_docs, per_source_k=per_doc_k)
+        print("[LocalIndex] Matches found:", len(results))
+        return _dedupe(results)
 
-    filter_payload = None
-    if filter_docs:
-        filter_payload = models.Filter(
-            must=[
-                models.FieldCondition(
-                    key="source",
-                    match=models.MatchAny(any=filter_docs)
-                )
-            ]
-        )
+    if not _confirm_collection():
+        raise RuntimeError(f"[Qdrant] Collection '{COLLECTION_NAME}' does not exist. Cannot perform search.")
 
+    filter_payload = _source_filter(filter_docs)
     print("[Qdrant] Filter:", filter_payload)
     print("[Qdrant] Querying with embedding length:", len(query_embedding))
-    results = client.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=query_embedding,
-        limit=k,
-        query_filter=filter_payload
-    )
+    try:
+        if filter_docs and per_doc_k:
+            groups = client.query_points_groups(
+                collection_name=COLLECTION_NAME,
+                query=query_embedding,
+                group_by="source",
+                limit=len(filter_docs),
+                group_size=per_doc_k,
+                query_filter=filter_payload,
+                search_params=_search_params(),
+                with_payload=True
+            ).groups
+            results = _flatten_groups(groups)
+        else:
+            results = client.query_points(
+                collection_name=COLLECTION_NAME,
+                query=query_embedding,
+                limit=k,
+                query_filter=filter_payload,
+                search_params=_search_params(),
+                with_payload=True
+            ).points
+    except Exception as e:
+        if _is_not_found(e):
+            _refresh_collections()
+            raise RuntimeError(f"[Qdrant] Collection '{COLLECTION_NAME}' does not exist. Cannot perform search.")
+        raise
     print("[Qdrant] Matches found:", len(results))
+    return _dedupe(results)
 
-    # --- ✅ Deduplicate by (text + source) ---
+# --- ✅ Async search for the API path ---
+async def asearch_similar(query_embedding, k=5, filter_docs=None, per_doc_k=None):
+    """
+    Non-blocking search_similar. Uses AsyncQdrantClient against a Qdrant server;
+    other backends run the sync search in a worker thread.
+    """
+    if async_client is None:
+        return await asyncio.to_thread(search_similar, query_embedding, k, filter_docs, per_doc_k)
+
+    if not _collection_exists() and not await asyncio.to_thread(_confirm_collection):
+        raise RuntimeError(f"[Qdrant] Collection '{COLLECTION_NAME}' does not exist. Cannot perform search.")
+
+    filter_payload = _source_filter(filter_docs)
+    try:
+        if filter_docs and per_doc_k:
+            response = await async_client.query_points_groups(
+                collection_name=COLLECTION_NAME,
+                query=query_embedding,
+                group_by="source",
+                limit=len(filter_docs),
+                group_size=per_doc_k,
+                query_filter=filter_payload,
+                search_params=_search_params(),
+                with_payload=True
+            )
+            results = _flatten_groups(response.groups)
+        else:
+            response = await async_client.query_points(
+                collection_name=COLLECTION_NAME,
+                query=query_embedding,
+                limit=k,
+                query_filter=filter_payload,
+                search_params=_search_params(),
+                with_payload=True
+            )
+            results = response.points
+    except Exception as e:
+        if _is_not_found(e):
+            await asyncio.to_thread(_refresh_collections)
+            raise RuntimeError(f"[Qdrant] Collection '{COLLECTION_NAME}' does not exist. Cannot perform search.")
+        raise
+    print("[Qdrant] Matches found:", len(results))
+    return _dedupe(results)
+
+async def asearch_similar_batch(query_embeddings, k=5, filter_docs=None, per_doc_k=None):
+    """
+    Run many searches in one Qdrant query_batch_points call. Grouped (per-document
+    quota) searches and non-server backends fall back to concurrent single searches.
+    """
+    if async_client is None or (filter_docs and per_doc_k):
+        return list(await asyncio.gather(
+            *(asearch_similar(e, k=k, filter_docs=filter_docs, per_doc_k=per_doc_k) for e in query_embeddings)
+        ))
+
+    if not _collection_exists() and not await asyncio.to_thread(_confirm_collection):
+        raise RuntimeError(f"[Qdrant] Collection '{COLLECTION_NAME}' does not exist. Cannot perform search.")
+
+    filter_payload = _source_filter(filter_docs)
+    requests = [
+        models.QueryRequest(
+            query=embedding,
+            filter=filter_payload,
+            limit=k,
+            params=_search_params(),
+            with_payload=True
+        )
+        for embedding in query_embeddings
+    ]
+    try:
+        responses = await async_client.query_batch_points(collection_name=COLLECTION_NAME, requests=requests)
+    except Exception as e:
+        if _is_not_found(e):
+            await asyncio.to_thread(_refresh_collections)
+            raise RuntimeError(f"[Qdrant] Collection '{COLLECTION_NAME}' does not exist. Cannot perform search.")
+        raise
+    print(f"[Qdrant] Batch search: {len(requests)} queries")
+    return [_dedupe(response.points) for response in responses]
+
+# --- ✅ Payloads by point ID (for keyword hits, which carry no text) ---
+def retrieve_payloads(ids: List[str]) -> Dict[str, Dict]:
+    if not ids:
+        return {}
+    if local_index is not None:
+        return local_index.get_payloads(list(ids))
+    if not _confirm_collection():
+        return {}
+    points = client.retrieve(collection_name=COLLECTION_NAME, ids=list(ids), with_payload=True, with_vectors=False)
+    return {str(p.id): p.payload for p in points}
+
+async def aretrieve_payloads(ids: List[str]) -> Dict[str, Dict]:
+    if async_client is None or not ids:
+        return await asyncio.to_thread(retrieve_payloads, ids)
+    if not _collection_exists() and not await asyncio.to_thread(_confirm_collection):
+        return {}
+    points = await async_client.retrieve(
+        collection_name=COLLECTION_NAME, ids=list(ids), with_payload=True, with_vectors=False
+    )
+    return {str(p.id): p.payload for p in points}
+
+def _source_filter(filter_docs):
+    if not filter_docs:
+        return None
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="source",
+                match=models.MatchAny(any=filter_docs)
+            )
+        ]
+    )
+
+def _flatten_groups(groups):
+    return sorted((hit for g in groups for hit in g.hits), key=lambda r: r.score, reverse=True)
+
+# --- ✅ Deduplicate by (text + source) ---
+def _dedupe(results):
     unique = {}
     for r in results:
         key = (r.payload.get("text"), r.payload.get("source"))
@@ -87,44 +431,90 @@ def search_similar(query_embedding, k=5, filter_docs=None):
     return deduped_results
 
 # --- ✅ Delete vectors by source (document name) ---
-def delete_vectors_by_source(source_name: str):
-    if COLLECTION_NAME not in [c.name for c in client.get_collections().collections]:
+def delete_vectors_by_sources(source_names: List[str]):
+    """
+    Delete every point whose source is in `source_names` with a single
+    filter-based delete, however many chunks the documents have.
+    """
+    if not source_names:
+        return
+    document_versions.remove(list(source_names))
+    if sparse_index is not None:
+        sparse_index.remove_sources(list(source_names))
+    if local_index is not None:
+        removed = local_index.delete_sources(list(source_names))
+        print(f"🗑️ Deleted {removed} vectors for {len(source_names)} source(s)")
+        return
+    if not _confirm_collection():
         print(f"[Qdrant] Collection '{COLLECTION_NAME}' does not exist.")
         return
 
-    # Search for all points with this source
-    filter_payload = models.Filter(
-        must=[
-            models.FieldCondition(
-                key="source",
-                match=models.MatchValue(value=source_name)
-            )
-        ]
-    )
+    print(f"🗑️ Deleting vectors for {len(source_names)} source(s)")
+    try:
+        client.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="source",
+                            match=models.MatchAny(any=list(source_names))
+                        )
+                    ]
+                )
+            ),
+            wait=True
+        )
+    except Exception as e:
+        if _is_not_found(e):
+            _refresh_collections()
+            print(f"[Qdrant] Collection '{COLLECTION_NAME}' does not exist.")
+            return
+        raise
 
-    hits = client.scroll(
-        collection_name=COLLECTION_NAME,
-        scroll_filter=filter_payload,
-        with_payload=False,
-        with_vectors=False,
-        limit=10000  # Adjust depending on your chunk volume
-    )
+def delete_vectors_by_source(source_name: str):
+    delete_vectors_by_sources([source_name])
 
-    ids_to_delete = [point.id for point in hits[0]]
 
-    if not ids_to_delete:
-        print(f"[Qdrant] No vectors found for source: {source_name}")
-    else:
-        print(f"🗑️ Deleting {len(ids_to_delete)} vectors for source: {source_name}")
-        client.delete(
-            collection_name=COLLECTION_NAME,
-            points_selector=models.PointIdsList(points=ids_to_delete)
+# --- ✅ Drop points left over from older versions of a document ---
+def delete_stale_versions(source_name: str, version: str):
+    # Called once the new version is fully upserted, so it is now the current one
+    document_versions.set(source_name, version)
+    if sparse_index is not None:
+        sparse_index.remove_stale_versions(source_name, version)
+    if local_index is not None:
+        removed = local_index.delete_stale_versions(source_name, version)
+        print(f"[LocalIndex] Removed {removed} stale vectors of '{source_name}' (current: {version})")
+        return
+    if not _confirm_collection():
+        return
+
+    # Also matches legacy points that carry no doc_version at all
+    client.delete(
+        collection_name=COLLECTION_NAME,
+        points_selector=models.FilterSelector(
+            filter=models.Filter(
+                must=[models.FieldCondition(key="source", match=models.MatchValue(value=source_name))],
+                must_not=[models.FieldCondition(key="doc_version", match=models.MatchValue(value=version))]
+            )
         )
+    )
+    print(f"[Qdrant] Removed stale versions of '{source_name}' (current: {version})")
 
 
 # --- ✅ Optional utilities ---
 def delete_collection():
+    global _indexes_ready
+    document_versions.clear()
+    if sparse_index is not None:
+        sparse_index.reset()
+    if local_index is not None:
+        local_index.reset()
+        return
     client.delete_collection(collection_name=COLLECTION_NAME)
+    with _collections_lock:
+        _collections.discard(COLLECTION_NAME)
+    _indexes_ready = False
 
 def reset_collection():
     delete_collection()